@@ -8,8 +8,9 @@ Generates a fresh keypair, signs "R3L: attest <content_hash>",
 and prints the pubkey + signature in base58 for pasting into the UI.
 """
 import sys
-import base58
-from nacl.signing import SigningKey
+import based58
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
 
 if len(sys.argv) != 2:
     print("Usage: python scripts/sign-message.py <content_hash>")
@@ -18,9 +19,10 @@ if len(sys.argv) != 2:
 content_hash = sys.argv[1]
 message = f"R3L: attest {content_hash}"
 
-key = SigningKey.generate()
-sig = key.sign(message.encode()).signature
+key = Ed25519PrivateKey.generate()
+sig = key.sign(message.encode())
+pubkey = key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
 
 print(f"Message: {message}")
-print(f"Pubkey:    {base58.b58encode(key.verify_key.encode()).decode()}")
-print(f"Signature: {base58.b58encode(sig).decode()}")
+print(f"Pubkey:    {based58.b58encode(pubkey).decode()}")
+print(f"Signature: {based58.b58encode(sig).decode()}")
@@ -1,19 +1,81 @@
+import hashlib
+import hmac
+import secrets
+import time
+from dataclasses import dataclass, field
+
 from fastapi import Header, HTTPException
 
+from ttl_store import ExpiringStore
 import db
 
+# ── API key cache ───────────────────────────────────────────────────
+# Keyed by an HMAC of the API key so plaintext keys never sit in the cache.
+# Invalid keys are cached briefly to blunt brute force without locking out
+# keys that are created moments later.
 
-async def require_api_key(x_api_key: str = Header(...)) -> dict:
-    """Check customers table first, then org_api_keys. Returns enriched dict."""
-    customer = await db.get_customer_by_api_key(x_api_key)
+API_KEY_TTL = 60.0
+INVALID_KEY_TTL = 5.0
+API_KEY_CACHE_MAX = 10_000
+
+_cache_secret = secrets.token_bytes(32)
+
+
+@dataclass
+class _CachedCaller:
+    caller: dict | None
+    created_at: float = field(default_factory=time.monotonic)
+
+
+# digest -> _CachedCaller; one store per TTL so each expires in insertion order
+_valid_keys = ExpiringStore(API_KEY_TTL, max_size=API_KEY_CACHE_MAX)
+_invalid_keys = ExpiringStore(INVALID_KEY_TTL, max_size=API_KEY_CACHE_MAX)
+
+
+def _cache_key(api_key: str) -> str:
+    return hmac.new(_cache_secret, api_key.encode(), hashlib.sha256).hexdigest()
+
+
+def _cache_get(digest: str) -> _CachedCaller | None:
+    now = time.monotonic()
+    for store in (_valid_keys, _invalid_keys):
+        hit = store.get(digest)
+        if hit is not None and now - hit.created_at <= store.ttl:
+            return hit
+    return None
+
+
+def _cache_put(digest: str, caller: dict | None):
+    store, other = (_valid_keys, _invalid_keys) if caller else (_invalid_keys, _valid_keys)
+    other.pop(digest)
+    store.put(digest, _CachedCaller(caller))
+
+
+def invalidate_api_key(*api_keys: str | None):
+    """Drop cached lookups after the identity behind a key changes."""
+    for api_key in api_keys:
+        if api_key:
+            digest = _cache_key(api_key)
+            _valid_keys.pop(digest)
+            _invalid_keys.pop(digest)
+
+
+def clear_api_key_cache():
+    global _valid_keys, _invalid_keys
+    _valid_keys = ExpiringStore(API_KEY_TTL, max_size=API_KEY_CACHE_MAX)
+    _invalid_keys = ExpiringStore(INVALID_KEY_TTL, max_size=API_KEY_CACHE_MAX)
+
+
+async def _lookup_api_key(api_key: str) -> dict | None:
+    customer = await db.get_customer_by_api_key(api_key)
     if customer:
         customer["type"] = "individual"
         return customer
 
     # Check org API keys
-    org_key = await db.get_org_api_key(x_api_key)
-    if org_key:
-        org = await db.get_organization_by_id(org_key["org_id"])
+    found = await db.get_org_api_key_with_org(api_key)
+    if found:
+        org_key, org = found
         return {
             "type": "org",
             "org_id": org_key["org_id"],
@@ -24,15 +86,43 @@ async def require_api_key(x_api_key: str = Header(...)) -> dict:
             "api_key": org_key["api_key"],
         }
 
-    raise HTTPException(401, "invalid API key")
+    return None
+
+
+async def _cached_caller(api_key: str) -> dict | None:
+    digest = _cache_key(api_key)
+    hit = _cache_get(digest)
+    if hit is not None:
+        return hit.caller
+    caller = await _lookup_api_key(api_key)
+    _cache_put(digest, caller)
+    return caller
+
+
+async def require_api_key(x_api_key: str = Header(...)) -> dict:
+    """Check customers table first, then org_api_keys. Returns enriched dict."""
+    caller = await _cached_caller(x_api_key)
+    if caller is None:
+        raise HTTPException(401, "invalid API key")
+    return dict(caller)
+
+
+async def optional_customer(api_key: str | None) -> dict | None:
+    """The individual account behind an optional API key, or None (no key, unknown key, org key)."""
+    if not api_key:
+        return None
+    caller = await _cached_caller(api_key)
+    if caller is None or caller["type"] != "individual":
+        return None
+    return dict(caller)
 
 
 async def require_org_admin(x_api_key: str = Header(...)) -> dict:
     """Require an org API key with admin role."""
-    org_key = await db.get_org_api_key(x_api_key)
-    if not org_key or org_key["role"] != "admin":
+    found = await db.get_org_api_key_with_org(x_api_key)
+    if not found or found[0]["role"] != "admin":
         raise HTTPException(403, "requires org admin API key")
-    org = await db.get_organization_by_id(org_key["org_id"])
+    org_key, org = found
     if not org:
         raise HTTPException(404, "organization not found")
     return {"org": org, "key": org_key}
@@ -0,0 +1,16 @@
+"""Base58 (Bitcoin alphabet) backed by the Rust `based58` package.
+
+Mirrors the pure-Python `base58` API it replaces: decode accepts str or bytes.
+"""
+
+import based58
+
+
+def b58encode(data: bytes) -> bytes:
+    return based58.b58encode(data)
+
+
+def b58decode(data: str | bytes) -> bytes:
+    if isinstance(data, str):
+        data = data.encode("ascii")
+    return based58.b58decode(data)
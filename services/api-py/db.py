@@ -1,41 +1,63 @@
+import asyncio
+import hmac
+import logging
+import string
 import time
 
-from sqlalchemy import select, text
+from sqlalchemy import String, cast, delete, func, literal, or_, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import BIT, insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import undefer
+from pgvector.sqlalchemy import HALFVEC
 
-from models import Attestation, Customer, Organization, OrgApiKey, Base
+import migrations
+from models import Attestation, Customer, EmailCode, Organization, OrgApiKey, Base, embedding_array
+
+# Core tables for read-only lookups — rows come back as mappings, no ORM hydration
+_customers = Customer.__table__
+_organizations = Organization.__table__
+_org_api_keys = OrgApiKey.__table__
+
+# HNSW candidate list size for CLIP search — higher = better recall, slower
+HNSW_EF_SEARCH = 40
+CLIP_RERANK_FACTOR = 10  # binary-quantized candidates fetched per requested CLIP match
+
+log = logging.getLogger(__name__)
 
 _engine = None
 _session_factory: async_sessionmaker[AsyncSession] | None = None
 
+# Plain columns for list/search views — selected as rows, no ORM hydration.
+# Excludes the 512-float clip_embedding and the internal tlsh_body bits.
+ATTESTATION_COLS = tuple(
+    c for c in Attestation.__table__.columns if c.name not in ("clip_embedding", "tlsh_body")
+)
 
-async def init_db(database_url: str):
+
+async def init_db(
+    database_url: str,
+    pool_size: int = 20,
+    max_overflow: int = 10,
+    run_migrations: bool = True,
+):
     global _engine, _session_factory
     # asyncpg requires postgresql+asyncpg:// scheme
     url = database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
-    _engine = create_async_engine(url, pool_size=5)
+    _engine = create_async_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=30,
+        pool_pre_ping=True,   # drop connections killed by network blips / PG restarts
+        pool_recycle=1800,
+    )
     _session_factory = async_sessionmaker(_engine, expire_on_commit=False)
     async with _engine.begin() as conn:
         await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
         await conn.run_sync(Base.metadata.create_all)
-        # Migrate existing tables — add columns that may not exist yet
-        migrations = [
-            "ALTER TABLE customers ADD COLUMN IF NOT EXISTS org_id INTEGER",
-            "ALTER TABLE customers ADD COLUMN IF NOT EXISTS email VARCHAR",
-            "ALTER TABLE customers ADD COLUMN IF NOT EXISTS auth_method VARCHAR",
-            "ALTER TABLE attestations ADD COLUMN IF NOT EXISTS org_id INTEGER",
-            "ALTER TABLE attestations ADD COLUMN IF NOT EXISTS org_domain VARCHAR",
-            "ALTER TABLE attestations ADD COLUMN IF NOT EXISTS content_type VARCHAR DEFAULT 'file'",
-            "ALTER TABLE attestations ADD COLUMN IF NOT EXISTS source_url VARCHAR",
-            "ALTER TABLE attestations ADD COLUMN IF NOT EXISTS mime_type VARCHAR",
-            "ALTER TABLE attestations ADD COLUMN IF NOT EXISTS content_size INTEGER",
-            "ALTER TABLE attestations ADD COLUMN IF NOT EXISTS stored BOOLEAN DEFAULT false",
-            "ALTER TABLE customers ADD COLUMN IF NOT EXISTS privacy_mode BOOLEAN DEFAULT false",
-            "ALTER TABLE attestations ADD COLUMN IF NOT EXISTS private BOOLEAN DEFAULT false",
-            "CREATE UNIQUE INDEX IF NOT EXISTS ix_customers_email ON customers(email) WHERE email IS NOT NULL",
-        ]
-        for sql in migrations:
-            await conn.execute(text(sql))
+        if run_migrations:
+            await migrations.run_migrations(conn)
 
 
 async def close_db():
@@ -52,113 +74,242 @@ def get_session() -> AsyncSession:
     return _session_factory()
 
 
-async def insert_attestation(
-    *,
-    content_hash: str,
-    proof_type: str = "trusted_verifier",
-    tx_signature: str | None = None,
-    pda: str | None = None,
-    has_c2pa: bool | None = None,
-    trust_list_match: str | None = None,
-    validation_state: str | None = None,
-    digital_source_type: str | None = None,
-    issuer: str | None = None,
-    common_name: str | None = None,
-    software_agent: str | None = None,
-    signing_time: str | None = None,
-    cert_fingerprint: str | None = None,
-    email_domain: str | None = None,
-    wallet_pubkey: str | None = None,
-    submitted_by: str | None = None,
-    verifier_version: str | None = None,
-    trust_bundle_hash: str | None = None,
-    tlsh_hash: str | None = None,
-    clip_embedding: list[float] | None = None,
-    org_id: int | None = None,
-    org_domain: str | None = None,
-    content_type: str = "file",
-    source_url: str | None = None,
-    mime_type: str | None = None,
-    content_size: int | None = None,
-    stored: bool = False,
-    private: bool = False,
-    created_at: int | None = None,
-):
+# Every row carries every column, so rows from different callers can share
+# one multi-row INSERT
+_INSERT_COLUMNS = tuple(c.name for c in Attestation.__table__.columns if c.name != "id")
+
+_ATTESTATION_DEFAULTS = {
+    "proof_type": "trusted_verifier",
+    "content_type": "file",
+    "stored": False,
+    "private": False,
+}
+
+
+def _attestation_row(fields: dict, now: int) -> dict:
+    unknown = fields.keys() - set(_INSERT_COLUMNS)
+    if unknown:
+        raise TypeError(f"unknown attestation columns: {sorted(unknown)}")
+    row = dict.fromkeys(_INSERT_COLUMNS)
+    row.update(_ATTESTATION_DEFAULTS, created_at=now)
+    row.update(fields)
+    if row["created_at"] is None:
+        row["created_at"] = now
+    return row
+
+
+async def insert_attestation(**fields):
+    """Insert one attestation. Keys are Attestation column names; content_hash is required.
+
+    Omitted columns take the model defaults. The insert may be batched with
+    concurrent ones (see Insert coalescing) but is committed when this returns.
+    """
     if _session_factory is None:
         return
-    if created_at is None:
-        created_at = int(time.time())
+    await _queue_attestation_insert(_attestation_row(fields, int(time.time())))
+
+
+async def insert_attestations(rows: list[dict]):
+    """Insert many attestation rows in one multi-row INSERT (one round-trip)."""
+    if _session_factory is None or not rows:
+        return
+    now = int(time.time())
+    values = []
+    for r in rows:
+        row = _attestation_row(r, now)
+        row["tlsh_body"] = _tlsh_body(row["tlsh_hash"])
+        values.append(row)
     async with get_session() as session:
-        stmt = select(Attestation).where(
-            Attestation.content_hash == content_hash,
+        # Content-addressed: a concurrent or repeat insert of the same hash is a no-op
+        stmt = (
+            pg_insert(Attestation)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=[Attestation.content_hash])
         )
-        existing = (await session.execute(stmt)).scalar_one_or_none()
-        if existing:
-            return
-        row = Attestation(
-            content_hash=content_hash,
-            proof_type=proof_type,
-            tx_signature=tx_signature,
-            pda=pda,
-            has_c2pa=has_c2pa,
-            trust_list_match=trust_list_match,
-            validation_state=validation_state,
-            digital_source_type=digital_source_type,
-            issuer=issuer,
-            common_name=common_name,
-            software_agent=software_agent,
-            signing_time=signing_time,
-            cert_fingerprint=cert_fingerprint,
-            email_domain=email_domain,
-            wallet_pubkey=wallet_pubkey,
-            submitted_by=submitted_by,
-            verifier_version=verifier_version,
-            trust_bundle_hash=trust_bundle_hash,
-            tlsh_hash=tlsh_hash,
-            clip_embedding=clip_embedding,
-            org_id=org_id,
-            org_domain=org_domain,
-            content_type=content_type,
-            source_url=source_url,
-            mime_type=mime_type,
-            content_size=content_size,
-            stored=stored,
-            private=private,
-            created_at=created_at,
+        await session.execute(stmt)
+        await session.commit()
+
+
+# ── Bulk import ────────────────────────────────────────────────────
+# Large loads go through COPY into a temp table, then a single
+# INSERT ... SELECT so ON CONFLICT still applies. clip_embedding travels as
+# pgvector's text form and tlsh_body is derived in SQL, so asyncpg needs no
+# custom type codecs.
+
+COPY_THRESHOLD = 50
+
+_COPY_COLUMNS = tuple(name for name in _INSERT_COLUMNS if name != "tlsh_body")
+
+
+def _copy_record(row: dict, now: int) -> tuple:
+    row = _attestation_row(row, now)
+    emb = row.get("clip_embedding")
+    if emb is not None:
+        row["clip_embedding"] = "[" + ",".join(map(str, emb)) + "]"
+    return tuple(row.get(name) for name in _COPY_COLUMNS)
+
+
+async def bulk_insert_attestations(rows: list[dict]):
+    """Import many attestation rows. Batches above COPY_THRESHOLD use COPY."""
+    if _session_factory is None or not rows:
+        return
+    if len(rows) <= COPY_THRESHOLD:
+        await insert_attestations(rows)
+        return
+
+    now = int(time.time())
+    records = [_copy_record(r, now) for r in rows]
+    cols = ", ".join(_COPY_COLUMNS)
+    staged = ", ".join(
+        "clip_embedding::text AS clip_embedding" if c == "clip_embedding" else c for c in _COPY_COLUMNS
+    )
+    selected = ", ".join(
+        "clip_embedding::halfvec" if c == "clip_embedding" else c for c in _COPY_COLUMNS
+    )
+    async with get_session() as session:
+        conn = await session.connection()
+        await conn.execute(text(
+            f"CREATE TEMP TABLE attestation_import ON COMMIT DROP AS "
+            f"SELECT {staged} FROM attestations WITH NO DATA"
+        ))
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            "attestation_import", records=records, columns=list(_COPY_COLUMNS),
         )
-        session.add(row)
+        await conn.execute(text(
+            f"INSERT INTO attestations ({cols}, tlsh_body) "
+            f"SELECT {selected}, CASE WHEN {migrations.TLSH_HASH_VALID_SQL} "
+            f"THEN {migrations.TLSH_BODY_SQL} END FROM attestation_import "
+            f"ON CONFLICT (content_hash) DO NOTHING"
+        ))
         await session.commit()
 
 
-async def get_attestation(content_hash: str) -> dict | None:
+# ── Insert coalescing ──────────────────────────────────────────────
+# Group commit: while one INSERT is in flight, concurrent insert_attestation
+# calls queue up and go out together in the next one. An idle server still
+# inserts immediately; under bursts the number of round-trips drops to
+# roughly one per in-flight batch.
+
+INSERT_BATCH_MAX = 100
+
+_insert_pending: list[tuple[dict, asyncio.Future]] = []
+_insert_flusher: asyncio.Task | None = None
+
+
+async def _queue_attestation_insert(row: dict):
+    global _insert_flusher
+    fut = asyncio.get_running_loop().create_future()
+    _insert_pending.append((row, fut))
+    if _insert_flusher is None or _insert_flusher.done():
+        _insert_flusher = asyncio.create_task(_flush_pending_inserts())
+    await fut
+
+
+async def _flush_pending_inserts():
+    while _insert_pending:
+        batch = _insert_pending[:INSERT_BATCH_MAX]
+        del _insert_pending[:len(batch)]
+        try:
+            await insert_attestations([row for row, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                _resolve(batch[0][1], e)
+                continue
+            # Don't let one bad row fail its neighbours — retry them one by one
+            log.warning("batched attestation insert failed (%s); retrying %d rows individually", e, len(batch))
+            for row, fut in batch:
+                try:
+                    await insert_attestations([row])
+                except Exception as row_error:
+                    _resolve(fut, row_error)
+                else:
+                    _resolve(fut)
+        else:
+            for _, fut in batch:
+                _resolve(fut)
+
+
+def _resolve(fut: asyncio.Future, error: Exception | None = None):
+    if fut.done():  # caller was cancelled; the row is still written
+        return
+    if error is None:
+        fut.set_result(None)
+    else:
+        fut.set_exception(error)
+
+
+async def get_attestation(content_hash: str, include_embedding: bool = False) -> dict | None:
     if _session_factory is None:
         return None
     async with get_session() as session:
         stmt = select(Attestation).where(
             Attestation.content_hash == content_hash,
         )
+        if include_embedding:
+            stmt = stmt.options(undefer(Attestation.clip_embedding))
         row = (await session.execute(stmt)).scalar_one_or_none()
         if row is None:
             return None
-        return row.to_dict()
+        return row.to_dict(include_embedding=include_embedding)
 
 
-async def list_attestations(include_private: bool = False) -> list[dict]:
+async def get_attestations(content_hashes: list[str]) -> dict[str, dict]:
+    """Attestations for many hashes in one query, keyed by content_hash. Misses are absent."""
+    if _session_factory is None or not content_hashes:
+        return {}
+    async with get_session() as session:
+        stmt = select(Attestation).where(Attestation.content_hash.in_(set(content_hashes)))
+        rows = (await session.execute(stmt)).scalars().all()
+        return {row.content_hash: row.to_dict() for row in rows}
+
+
+async def list_attestations(
+    include_private: bool = False,
+    include_embedding: bool = False,
+    limit: int | None = None,
+    after: tuple[int, int] | None = None,
+) -> list[dict]:
+    """Newest first. `after` is a (created_at, id) keyset cursor from the previous page."""
     if _session_factory is None:
         return []
     async with get_session() as session:
-        stmt = select(Attestation).order_by(Attestation.created_at.desc())
+        cols = ATTESTATION_COLS + (Attestation.clip_embedding,) if include_embedding else ATTESTATION_COLS
+        stmt = select(*cols).order_by(Attestation.created_at.desc(), Attestation.id.desc())
         if not include_private:
             stmt = stmt.where(Attestation.private == False)
-        rows = (await session.execute(stmt)).scalars().all()
-        return [r.to_dict() for r in rows]
+        if after is not None:
+            stmt = stmt.where(tuple_(Attestation.created_at, Attestation.id) < after)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        rows = (await session.execute(stmt)).mappings().all()
+        results = [dict(r) for r in rows]
+        if include_embedding:
+            for d in results:
+                d["clip_embedding"] = embedding_array(d["clip_embedding"])
+        return results
+
+
+async def set_attestation_stored(content_hash: str, stored: bool):
+    if _session_factory is None:
+        return
+    async with get_session() as session:
+        await session.execute(
+            update(Attestation).where(Attestation.content_hash == content_hash).values(stored=stored)
+        )
+        await session.commit()
 
 
 # ── Customer functions ──────────────────────────────────────────────
 
+class EmailTaken(Exception):
+    """The email is already on another customer (ix_customers_email)."""
+
+
 async def insert_customer(
     *, name: str, api_key: str, wallet_pubkey: str | None = None,
     email: str | None = None, auth_method: str | None = None,
+    org_id: int | None = None,
 ) -> dict:
     if _session_factory is None:
         raise RuntimeError("DB not initialized")
@@ -169,6 +320,7 @@ async def insert_customer(
             auth_method=auth_method,
             wallet_pubkey=wallet_pubkey,
             api_key=api_key,
+            org_id=org_id,
             created_at=int(time.time()),
         )
         session.add(row)
@@ -180,45 +332,62 @@ async def get_customer_by_api_key(api_key: str) -> dict | None:
     if _session_factory is None:
         return None
     async with get_session() as session:
-        stmt = select(Customer).where(Customer.api_key == api_key)
-        row = (await session.execute(stmt)).scalar_one_or_none()
-        if row is None:
-            return None
-        return row.to_dict()
+        stmt = select(_customers).where(_customers.c.api_key == api_key)
+        row = (await session.execute(stmt)).mappings().one_or_none()
+        return dict(row) if row else None
 
 
 async def get_customer_by_wallet(wallet_pubkey: str) -> dict | None:
     if _session_factory is None:
         return None
     async with get_session() as session:
-        stmt = select(Customer).where(Customer.wallet_pubkey == wallet_pubkey)
-        row = (await session.execute(stmt)).scalar_one_or_none()
-        if row is None:
-            return None
-        return row.to_dict()
+        stmt = select(_customers).where(_customers.c.wallet_pubkey == wallet_pubkey)
+        row = (await session.execute(stmt)).mappings().one_or_none()
+        return dict(row) if row else None
+
+
+async def find_customer(*, wallet_pubkey: str | None = None, email: str | None = None) -> dict | None:
+    """The customer matching either identity, in one query. A wallet match wins."""
+    if _session_factory is None:
+        return None
+    conds = []
+    if wallet_pubkey:
+        conds.append(_customers.c.wallet_pubkey == wallet_pubkey)
+    if email:
+        conds.append(_customers.c.email == email)
+    if not conds:
+        return None
+    async with get_session() as session:
+        rows = (await session.execute(select(_customers).where(or_(*conds)))).mappings().all()
+    for row in rows:
+        if wallet_pubkey and row["wallet_pubkey"] == wallet_pubkey:
+            return dict(row)
+    return dict(rows[0]) if rows else None
 
 
 async def get_customer_by_email(email: str) -> dict | None:
     if _session_factory is None:
         return None
     async with get_session() as session:
-        stmt = select(Customer).where(Customer.email == email)
-        row = (await session.execute(stmt)).scalar_one_or_none()
-        if row is None:
-            return None
-        return row.to_dict()
+        stmt = select(_customers).where(_customers.c.email == email)
+        row = (await session.execute(stmt)).mappings().one_or_none()
+        return dict(row) if row else None
 
 
 async def link_email_to_customer(customer_id: int, email: str):
+    """Set a customer's email; raises EmailTaken if another customer has it."""
     if _session_factory is None:
         raise RuntimeError("DB not initialized")
     async with get_session() as session:
-        stmt = select(Customer).where(Customer.id == customer_id)
-        row = (await session.execute(stmt)).scalar_one_or_none()
-        if row is None:
+        try:
+            result = await session.execute(
+                update(Customer).where(Customer.id == customer_id).values(email=email)
+            )
+            await session.commit()
+        except IntegrityError:
+            raise EmailTaken(email)
+        if result.rowcount == 0:
             raise RuntimeError("customer not found")
-        row.email = email
-        await session.commit()
 
 
 async def link_wallet_to_customer(customer_id: int, wallet_pubkey: str):
@@ -233,6 +402,18 @@ async def link_wallet_to_customer(customer_id: int, wallet_pubkey: str):
         await session.commit()
 
 
+async def set_customer_org(customer_id: int, org_id: int) -> bool:
+    """Point a customer at an organization in one UPDATE. False if no such customer."""
+    if _session_factory is None:
+        raise RuntimeError("DB not initialized")
+    async with get_session() as session:
+        result = await session.execute(
+            update(Customer).where(Customer.id == customer_id).values(org_id=org_id)
+        )
+        await session.commit()
+        return result.rowcount > 0
+
+
 async def update_customer_privacy_mode(customer_id: int, privacy_mode: bool) -> dict:
     if _session_factory is None:
         raise RuntimeError("DB not initialized")
@@ -252,8 +433,15 @@ async def merge_customers(keep_id: int, remove_id: int) -> dict:
     if _session_factory is None:
         raise RuntimeError("DB not initialized")
     async with get_session() as session:
-        keep = (await session.execute(select(Customer).where(Customer.id == keep_id))).scalar_one_or_none()
-        remove = (await session.execute(select(Customer).where(Customer.id == remove_id))).scalar_one_or_none()
+        # Lock both rows in one query so concurrent merges serialize
+        stmt = (
+            select(Customer)
+            .where(Customer.id.in_([keep_id, remove_id]))
+            .order_by(Customer.id)
+            .with_for_update()
+        )
+        rows = {c.id: c for c in (await session.execute(stmt)).scalars().all()}
+        keep, remove = rows.get(keep_id), rows.get(remove_id)
         if not keep or not remove:
             raise RuntimeError("customer not found")
 
@@ -278,45 +466,89 @@ async def merge_customers(keep_id: int, remove_id: int) -> dict:
         # Delete the removed account
         await session.delete(remove)
         await session.commit()
-        await session.refresh(keep)
         return keep.to_dict()
 
 
 # ── Similarity search functions ───────────────────────────────────
 
-async def get_all_with_tlsh() -> list[dict]:
-    """Return all attestations that have a TLSH hash."""
+def _tlsh_body(tlsh_hash: str | None):
+    """BIT(256) SQL expression for the bucket body of a TLSH hash, or None if malformed."""
+    if not tlsh_hash:
+        return None
+    body = tlsh_hash[2:] if tlsh_hash.startswith("T1") else tlsh_hash
+    if len(body) != 70 or not all(c in string.hexdigits for c in body):
+        return None
+    # Skip the 3 header bytes (checksum, L-value, Q-ratios)
+    return cast(literal("x" + body[6:], String), BIT(256))
+
+
+async def get_similar_tlsh(tlsh_hash: str, limit: int = 100) -> list[dict]:
+    """Top-k TLSH candidates, ranked in SQL by Hamming distance over the bucket bits.
+
+    Hamming distance only approximates tlsh.diff, so callers should fetch a few
+    times more rows than they need and re-score them exactly.
+    """
     if _session_factory is None:
         return []
+    query_body = _tlsh_body(tlsh_hash)
+    if query_body is None:
+        return []
     async with get_session() as session:
-        stmt = select(Attestation).where(Attestation.tlsh_hash.isnot(None))
+        stmt = (
+            select(Attestation)
+            .options(undefer(Attestation.clip_embedding))
+            .where(Attestation.tlsh_body.isnot(None))
+            .order_by(func.bit_count(Attestation.tlsh_body.op("#")(query_body)))
+            .limit(limit)
+        )
         rows = (await session.execute(stmt)).scalars().all()
-        return [r.to_dict() for r in rows]
+        return [r.to_dict(include_embedding=True) for r in rows]
+
+
+def _binary_quantize(embedding):
+    # Must match the ix_attestations_clip_bq_hnsw index expression
+    return cast(func.binary_quantize(embedding), BIT(512))
 
 
 async def search_similar_clip(
     embedding: list[float], limit: int = 20,
 ) -> list[dict]:
-    """Find attestations with similar CLIP embeddings using pgvector cosine distance."""
+    """Find attestations with similar CLIP embeddings.
+
+    Two stages: CLIP_RERANK_FACTOR × limit candidates by Hamming distance over
+    the binary-quantized embeddings (HNSW-indexed), re-ranked by exact cosine
+    distance on the halfvec column.
+    """
     if _session_factory is None:
         return []
+    query = cast(literal(embedding, HALFVEC(512)), HALFVEC(512))
+    # an HNSW scan returns at most ef_search rows
+    ef_search = max(HNSW_EF_SEARCH, limit * CLIP_RERANK_FACTOR)
     async with get_session() as session:
+        await session.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+        candidates = (
+            select(*ATTESTATION_COLS, Attestation.clip_embedding)
+            .where(Attestation.clip_embedding.isnot(None))
+            .order_by(_binary_quantize(Attestation.clip_embedding).op("<~>")(_binary_quantize(query)))
+            .limit(limit * CLIP_RERANK_FACTOR)
+            .subquery()
+        )
         # cosine distance: <=> returns distance (0=identical, 2=opposite)
         # similarity = 1 - distance
+        distance = candidates.c.clip_embedding.cosine_distance(query)
         stmt = (
             select(
-                Attestation,
-                (1 - Attestation.clip_embedding.cosine_distance(embedding)).label("clip_similarity"),
+                *(candidates.c[c.name] for c in ATTESTATION_COLS),
+                (1 - distance).label("clip_similarity"),
             )
-            .where(Attestation.clip_embedding.isnot(None))
-            .order_by(Attestation.clip_embedding.cosine_distance(embedding))
+            .order_by(distance)
             .limit(limit)
         )
-        rows = (await session.execute(stmt)).all()
+        rows = (await session.execute(stmt)).mappings().all()
         results = []
-        for row, similarity in rows:
-            d = row.to_dict()
-            d["clip_similarity"] = round(float(similarity), 4)
+        for row in rows:
+            d = dict(row)
+            d["clip_similarity"] = round(float(d["clip_similarity"]), 4)
             results.append(d)
         return results
 
@@ -352,32 +584,50 @@ async def get_organization_by_domain(domain: str) -> dict | None:
     if _session_factory is None:
         return None
     async with get_session() as session:
-        stmt = select(Organization).where(Organization.domain == domain)
-        row = (await session.execute(stmt)).scalar_one_or_none()
-        return row.to_dict() if row else None
+        stmt = select(_organizations).where(_organizations.c.domain == domain)
+        row = (await session.execute(stmt)).mappings().one_or_none()
+        return dict(row) if row else None
 
 
 async def get_organization_by_id(org_id: int) -> dict | None:
     if _session_factory is None:
         return None
     async with get_session() as session:
-        stmt = select(Organization).where(Organization.id == org_id)
-        row = (await session.execute(stmt)).scalar_one_or_none()
-        return row.to_dict() if row else None
+        stmt = select(_organizations).where(_organizations.c.id == org_id)
+        row = (await session.execute(stmt)).mappings().one_or_none()
+        return dict(row) if row else None
+
+
+async def update_organization(org_id: int, **values) -> dict | None:
+    """UPDATE ... RETURNING in one round-trip. Returns the updated row, or None."""
+    if _session_factory is None:
+        return None
+    async with get_session() as session:
+        stmt = (
+            update(_organizations)
+            .where(_organizations.c.id == org_id)
+            .values(**values)
+            .returning(*_organizations.c)
+        )
+        row = (await session.execute(stmt)).mappings().one_or_none()
+        await session.commit()
+        return dict(row) if row else None
 
 
 async def verify_organization(domain: str) -> dict | None:
+    """Mark an organization verified with UPDATE ... RETURNING. Returns the row, or None."""
     if _session_factory is None:
         return None
     async with get_session() as session:
-        stmt = select(Organization).where(Organization.domain == domain)
-        row = (await session.execute(stmt)).scalar_one_or_none()
-        if not row:
-            return None
-        row.verified = True
+        stmt = (
+            update(_organizations)
+            .where(_organizations.c.domain == domain)
+            .values(verified=True)
+            .returning(*_organizations.c)
+        )
+        row = (await session.execute(stmt)).mappings().one_or_none()
         await session.commit()
-        await session.refresh(row)
-        return row.to_dict()
+        return dict(row) if row else None
 
 
 # ── Org API Key functions ──────────────────────────────────────────
@@ -406,21 +656,42 @@ async def get_org_api_key(api_key: str) -> dict | None:
     if _session_factory is None:
         return None
     async with get_session() as session:
-        stmt = select(OrgApiKey).where(
-            OrgApiKey.api_key == api_key,
-            OrgApiKey.revoked == False,
+        stmt = select(_org_api_keys).where(
+            _org_api_keys.c.api_key == api_key,
+            _org_api_keys.c.revoked == False,
         )
-        row = (await session.execute(stmt)).scalar_one_or_none()
-        return row.to_dict() if row else None
+        row = (await session.execute(stmt)).mappings().one_or_none()
+        return dict(row) if row else None
+
+
+async def get_org_api_key_with_org(api_key: str) -> tuple[dict, dict | None] | None:
+    """Active org API key and its organization in one round-trip."""
+    if _session_factory is None:
+        return None
+    async with get_session() as session:
+        stmt = (
+            select(OrgApiKey, Organization)
+            .outerjoin(Organization, OrgApiKey.org_id == Organization.id)
+            .where(OrgApiKey.api_key == api_key, OrgApiKey.revoked == False)
+        )
+        row = (await session.execute(stmt)).one_or_none()
+        if row is None:
+            return None
+        key, org = row
+        return key.to_dict(), org.to_dict() if org else None
 
 
 async def list_org_api_keys(org_id: int) -> list[dict]:
     if _session_factory is None:
         return []
     async with get_session() as session:
-        stmt = select(OrgApiKey).where(OrgApiKey.org_id == org_id).order_by(OrgApiKey.created_at.desc())
-        rows = (await session.execute(stmt)).scalars().all()
-        return [r.to_dict() for r in rows]
+        stmt = (
+            select(_org_api_keys)
+            .where(_org_api_keys.c.org_id == org_id)
+            .order_by(_org_api_keys.c.created_at.desc())
+        )
+        rows = (await session.execute(stmt)).mappings().all()
+        return [dict(r) for r in rows]
 
 
 async def revoke_org_api_key(key_id: int, org_id: int) -> bool:
@@ -434,3 +705,58 @@ async def revoke_org_api_key(key_id: int, org_id: int) -> bool:
         row.revoked = True
         await session.commit()
         return True
+
+
+# ── Email verification codes ───────────────────────────────────────
+# Shared by every worker. A check locks the code's row, so concurrent guesses
+# for one email are serialized and the attempt limit holds across processes.
+
+async def put_email_code(scope: str, email: str, code: str, ttl: int, domain: str | None = None):
+    """Issue (or replace) the pending code for (scope, email); resets attempts."""
+    if _session_factory is None:
+        raise RuntimeError("DB not initialized")
+    now = int(time.time())
+    values = {"code": code, "domain": domain, "attempts": 0, "expires_at": now + ttl}
+    async with get_session() as session:
+        # Expired codes are reclaimed here, via the expires_at index
+        await session.execute(delete(EmailCode).where(EmailCode.expires_at <= now))
+        await session.execute(
+            pg_insert(EmailCode)
+            .values(scope=scope, email=email, **values)
+            .on_conflict_do_update(index_elements=[EmailCode.scope, EmailCode.email], set_=values)
+        )
+        await session.commit()
+
+
+async def check_email_code(scope: str, email: str, code: str, max_attempts: int) -> tuple[str, dict | None]:
+    """Check a submitted code atomically. Returns (outcome, row).
+
+    outcome is "ok" (code consumed), "missing", "expired", "exhausted" (code
+    dropped), or "wrong" (row["attempts"] is the updated count).
+    """
+    if _session_factory is None:
+        raise RuntimeError("DB not initialized")
+    async with get_session() as session:
+        stmt = (
+            select(EmailCode)
+            .where(EmailCode.scope == scope, EmailCode.email == email)
+            .with_for_update()
+        )
+        row = (await session.execute(stmt)).scalar_one_or_none()
+        if row is None:
+            return "missing", None
+        entry = row.to_dict()
+        if row.expires_at <= int(time.time()):
+            outcome = "expired"
+        elif row.attempts >= max_attempts:
+            outcome = "exhausted"
+        elif not hmac.compare_digest(row.code.encode(), code.encode()):
+            row.attempts += 1
+            entry["attempts"] = row.attempts
+            outcome = "exhausted" if row.attempts >= max_attempts else "wrong"
+        else:
+            outcome = "ok"
+        if outcome != "wrong":
+            await session.delete(row)
+        await session.commit()
+        return outcome, entry
@@ -4,39 +4,46 @@ Supports did:pkh, did:jwk, did:key, and did:web methods.
 """
 
 import base64
+import functools
 import json
 
-import base58
+import b58
+
+# CAIP-2 chain id for Solana mainnet
+SOLANA_CHAIN_ID = "5eykt4UsFv8P8NJdTREpY1vzqKqZKvdp"
+_PKH_PREFIX = f"did:pkh:solana:{SOLANA_CHAIN_ID}:"
+
+# Canonical (sorted-key, compact) OKP/Ed25519 JWK around the base64url "x" value
+_JWK_PREFIX = b'{"crv":"Ed25519","kty":"OKP","x":"'
+_JWK_SUFFIX = b'"}'
 
 
 def format_did_pkh(wallet_pubkey: str) -> str:
     """did:pkh:solana:{pubkey} — CAIP-10 style for Solana wallets."""
-    return f"did:pkh:solana:5eykt4UsFv8P8NJdTREpY1vzqKqZKvdp:{wallet_pubkey}"
+    return _PKH_PREFIX + wallet_pubkey
 
 
+@functools.lru_cache(maxsize=4096)
 def format_did_jwk(ed25519_pubkey_bytes: bytes) -> str:
     """did:jwk:{base64url} — RFC 8037 OKP/Ed25519 JWK."""
-    jwk = {
-        "kty": "OKP",
-        "crv": "Ed25519",
-        "x": base64.urlsafe_b64encode(ed25519_pubkey_bytes).rstrip(b"=").decode(),
-    }
-    jwk_json = json.dumps(jwk, separators=(",", ":"), sort_keys=True)
-    encoded = base64.urlsafe_b64encode(jwk_json.encode()).rstrip(b"=").decode()
+    x = base64.urlsafe_b64encode(ed25519_pubkey_bytes).rstrip(b"=")
+    jwk_json = _JWK_PREFIX + x + _JWK_SUFFIX
+    encoded = base64.urlsafe_b64encode(jwk_json).rstrip(b"=").decode()
     return f"did:jwk:{encoded}"
 
 
+@functools.lru_cache(maxsize=4096)
 def format_did_key(ed25519_pubkey_bytes: bytes) -> str:
     """did:key:z{multibase} — multicodec 0xed01 prefix for Ed25519."""
     # Ed25519 multicodec prefix: 0xed (varint encoded as 0xed 0x01)
     prefixed = b"\xed\x01" + ed25519_pubkey_bytes
-    multibase = "z" + base58.b58encode(prefixed).decode()
+    multibase = "z" + b58.b58encode(prefixed).decode()
     return f"did:key:{multibase}"
 
 
 def format_did_web(domain: str) -> str:
     """did:web:{domain} — domain-based DID."""
-    return f"did:web:{domain}"
+    return "did:web:" + domain
 
 
 def resolve_did(did_string: str) -> dict:
@@ -68,35 +75,33 @@ def resolve_did(did_string: str) -> dict:
                 "blockchainAccountId": f"solana:{parts[3]}:{parts[4]}",
             }]
     elif method == "jwk":
-        encoded = parts[2]
-        # Restore base64url padding
-        padded = encoded + "=" * (4 - len(encoded) % 4) if len(encoded) % 4 else encoded
+        # The decoder ignores surplus padding, so always append the maximum
         try:
-            jwk = json.loads(base64.urlsafe_b64decode(padded))
+            jwk = json.loads(base64.urlsafe_b64decode(parts[2] + "==="))
+        except Exception:
+            jwk = None
+        if jwk is not None:
             doc["verificationMethod"] = [{
                 "id": f"{did_string}#0",
                 "type": "JsonWebKey2020",
                 "controller": did_string,
                 "publicKeyJwk": jwk,
             }]
-        except Exception:
-            pass
     elif method == "key":
         multibase = parts[2]
         if multibase.startswith("z"):
             try:
-                decoded = base58.b58decode(multibase[1:])
-                # Strip 0xed01 prefix
-                if decoded[:2] == b"\xed\x01":
-                    pub_bytes = decoded[2:]
-                    doc["verificationMethod"] = [{
-                        "id": f"{did_string}#{multibase}",
-                        "type": "Ed25519VerificationKey2020",
-                        "controller": did_string,
-                        "publicKeyMultibase": multibase,
-                    }]
+                decoded = b58.b58decode(multibase[1:])
             except Exception:
-                pass
+                decoded = b""
+            # Ed25519 keys carry the 0xed01 multicodec prefix
+            if decoded[:2] == b"\xed\x01":
+                doc["verificationMethod"] = [{
+                    "id": f"{did_string}#{multibase}",
+                    "type": "Ed25519VerificationKey2020",
+                    "controller": did_string,
+                    "publicKeyMultibase": multibase,
+                }]
 
     return doc
 
@@ -111,7 +116,7 @@ def get_all_dids_for_org(org: dict, wallet_pubkey: str | None = None) -> dict:
     if wallet_pubkey:
         dids["did:pkh"] = format_did_pkh(wallet_pubkey)
         try:
-            pub_bytes = base58.b58decode(wallet_pubkey)
+            pub_bytes = b58.b58decode(wallet_pubkey)
             dids["did:jwk"] = format_did_jwk(pub_bytes)
             dids["did:key"] = format_did_key(pub_bytes)
         except Exception:
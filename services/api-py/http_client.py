@@ -0,0 +1,33 @@
+"""Shared outbound HTTP client.
+
+Call init_http_client() once at startup and close_http_client() on shutdown.
+Then use get_http_client() so repeat fetches reuse pooled connections.
+"""
+
+import httpx
+
+_client: httpx.AsyncClient | None = None
+
+
+def init_http_client() -> httpx.AsyncClient:
+    global _client
+    _client = httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=30,
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=100, max_connections=500),
+    )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("HTTP client not initialized — call init_http_client() first")
+    return _client
@@ -0,0 +1,117 @@
+"""Outbound email over reused SMTP connections.
+
+send_email() is blocking; call it via asyncio.to_thread(), or schedule
+send_email_logged() as a FastAPI background task. Authenticated
+SMTP_SSL connections are kept in a small idle pool, so repeat sends skip the
+TLS handshake and LOGIN.
+"""
+
+import logging
+import smtplib
+import threading
+from email.message import Message
+from email.mime.text import MIMEText
+
+from config import Settings
+
+log = logging.getLogger(__name__)
+
+SMTP_PORT = 465
+SMTP_POOL_SIZE = 4  # idle connections kept open
+
+_idle: list[smtplib.SMTP_SSL] = []
+_lock = threading.Lock()
+
+
+def _connect(settings: Settings) -> smtplib.SMTP_SSL:
+    server = smtplib.SMTP_SSL(settings.smtp_host, SMTP_PORT)
+    server.login(settings.smtp_user, settings.smtp_pass)
+    return server
+
+
+def _close(server: smtplib.SMTP_SSL):
+    try:
+        server.quit()
+    except Exception:
+        server.close()
+
+
+# ── Verification code emails ────────────────────────────────────────
+# The shared layout is filled per purpose once, at import; per request only
+# the code is substituted.
+
+_CODE_PLACEHOLDER = "{code}"
+
+_VERIFICATION_LAYOUT = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"></head>
+<body style="font-family:system-ui,sans-serif;background:#0a0a0f;color:#e5e5e5;margin:0;padding:40px;">
+<div style="max-width:480px;margin:0 auto;background:#1a1a2e;border:1px solid #2d2d44;border-radius:12px;padding:40px;text-align:center;">
+<h1 style="color:#facc15;margin:0 0 8px;font-size:24px;">R3L Provenance</h1>
+<p style="color:#9ca3af;margin:0 0 24px;">{intro}</p>
+<p style="color:#e5e5e5;margin:0 0 8px;">{label}</p>
+<p style="font-size:36px;font-weight:700;color:#facc15;letter-spacing:8px;margin:0 0 24px;">{code}</p>
+<p style="color:#6b7280;font-size:12px;margin:0;">This code expires in 30 minutes.</p>
+</div>
+</body></html>"""
+
+
+def verification_template(intro: str, label: str = "Your verification code:") -> str:
+    """Verification email HTML with only the code left to fill in (see code_email)."""
+    return _VERIFICATION_LAYOUT.replace("{intro}", intro).replace("{label}", label)
+
+
+def code_email(settings: Settings, template: str, code: str, subject: str, to: str) -> MIMEText:
+    msg = MIMEText(template.replace(_CODE_PLACEHOLDER, code), "html")
+    msg["Subject"] = subject
+    msg["From"] = settings.smtp_from or settings.smtp_user
+    msg["To"] = to
+    return msg
+
+
+# ── Sending ─────────────────────────────────────────────────────────
+
+def _release(server: smtplib.SMTP_SSL):
+    """Return a healthy connection to the idle pool, or close it if the pool is full."""
+    with _lock:
+        if len(_idle) < SMTP_POOL_SIZE:
+            _idle.append(server)
+            return
+    _close(server)
+
+
+def _send(server: smtplib.SMTP_SSL, msg: Message):
+    try:
+        server.send_message(msg)
+    except (smtplib.SMTPServerDisconnected, ConnectionError):
+        server.close()
+        raise
+    except smtplib.SMTPException:
+        # Refused recipient/sender or rejected data: the message failed, the
+        # connection is fine (smtplib has already sent RSET)
+        _release(server)
+        raise
+    except Exception:
+        _close(server)
+        raise
+    _release(server)
+
+
+def send_email(settings: Settings, msg: Message):
+    with _lock:
+        server = _idle.pop() if _idle else None
+
+    if server is not None:
+        try:
+            _send(server, msg)
+            return
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            pass  # the server timed out the idle connection — retry on a fresh one
+    _send(_connect(settings), msg)
+
+
+def send_email_logged(settings: Settings, msg: Message):
+    """send_email for background tasks, which have no response left to fail — errors are logged."""
+    try:
+        send_email(settings, msg)
+    except Exception:
+        log.exception("failed to send email to %s", msg["To"])
@@ -1,38 +1,63 @@
+import asyncio
+import logging
 import os
-import threading
 
 from dotenv import load_dotenv
 
 # Load .env before anything reads env vars
 load_dotenv(os.path.join(os.path.dirname(__file__), "../../.env"))
 
-from pathlib import Path
-
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.exceptions import HTTPException as StarletteHTTPException
 
-from config import Settings
+from config import get_settings
 from routes import verify, attest, prove, submit, attestation, edge, query, similar, org, did_route, auth_routes, content, developer
 import db
+from http_client import close_http_client, init_http_client
+from solana_tx import close_rpc_clients
 from similarity import init_similarity
 from storage import init_storage
 
-settings = Settings()
-app = FastAPI()
+settings = get_settings()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 
 @app.on_event("startup")
 async def startup():
-    await db.init_db(settings.database_url)
+    await db.init_db(
+        settings.database_url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        run_migrations=settings.run_migrations,
+    )
     init_storage(settings)
-    # Load CLIP model in background so health checks pass immediately
-    threading.Thread(target=init_similarity, daemon=True).start()
+    init_http_client()
+    # Load CLIP model in background so health checks pass immediately;
+    # similarity routes return 503 until similarity_ready is set, or fall
+    # back to TLSH-only matching if the load failed
+    app.state.similarity_ready = asyncio.Event()
+    app.state.similarity_failed = False
+    app.state.similarity_task = asyncio.create_task(_load_similarity())
+
+
+async def _load_similarity():
+    try:
+        content_types = tuple(p.strip().lower() for p in settings.clip_content_types.split(",") if p.strip())
+        await asyncio.to_thread(init_similarity, content_types)
+    except Exception:
+        logging.getLogger(__name__).exception("failed to load CLIP model")
+        app.state.similarity_failed = True
+        return
+    app.state.similarity_ready.set()
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await close_http_client()
+    await close_rpc_clients()
     await db.close_db()
 
 # CORS — allow all (matches Rust API)
@@ -54,10 +79,12 @@ async def reset_db():
     """Drop and recreate all tables. Dev/staging only."""
     from sqlalchemy import text
     from models import Base
+    import migrations
     async with db._engine.begin() as conn:
-        await conn.execute(text("DROP TABLE IF EXISTS attestations, customers, organizations, org_api_keys CASCADE"))
+        await conn.execute(text("DROP TABLE IF EXISTS attestations, customers, organizations, org_api_keys, email_codes CASCADE"))
         await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
         await conn.run_sync(Base.metadata.create_all)
+        await migrations.run_migrations(conn)
     return {"status": "ok", "message": "All tables dropped and recreated"}
 
 
@@ -81,15 +108,21 @@ from routes.did_route import platform_did
 app.add_api_route("/.well-known/did.json", platform_did, methods=["GET"])
 
 # Static files — Vue SPA (must be last)
-static_dir = settings.static_dir
-if os.path.isdir(static_dir):
-    index_html = Path(static_dir) / "index.html"
+class SPAStaticFiles(StaticFiles):
+    """StaticFiles that serves index.html for unknown paths (client-side routing)."""
 
-    @app.get("/{full_path:path}")
-    async def spa_fallback(full_path: str):
-        # Serve actual static files if they exist, otherwise index.html for SPA routing
-        static_path = Path(static_dir) / full_path
-        if static_path.is_file():
-            return FileResponse(static_path)
-        return FileResponse(index_html)
+    async def get_response(self, path: str, scope):
+        try:
+            response = await super().get_response(path, scope)
+        except StarletteHTTPException as e:
+            if e.status_code != 404:
+                raise
+            return await super().get_response("index.html", scope)
+        if response.status_code == 404:
+            return await super().get_response("index.html", scope)
+        return response
 
+
+static_dir = settings.static_dir
+if os.path.isdir(static_dir):
+    app.mount("/", SPAStaticFiles(directory=static_dir, html=True), name="spa")
@@ -0,0 +1,87 @@
+"""Schema migrations for tables created before a column or index existed.
+
+run_migrations(conn) reads the live schema once and only issues the DDL that
+is actually missing, so routine restarts take no ACCESS EXCLUSIVE locks.
+"""
+
+from sqlalchemy import text
+
+# (table, column, type) — added with ADD COLUMN IF NOT EXISTS when missing
+COLUMNS = [
+    ("customers", "org_id", "INTEGER"),
+    ("customers", "email", "VARCHAR"),
+    ("customers", "auth_method", "VARCHAR"),
+    ("customers", "privacy_mode", "BOOLEAN DEFAULT false"),
+    ("attestations", "org_id", "INTEGER"),
+    ("attestations", "org_domain", "VARCHAR"),
+    ("attestations", "content_type", "VARCHAR DEFAULT 'file'"),
+    ("attestations", "source_url", "VARCHAR"),
+    ("attestations", "mime_type", "VARCHAR"),
+    ("attestations", "content_size", "INTEGER"),
+    ("attestations", "stored", "BOOLEAN DEFAULT false"),
+    ("attestations", "private", "BOOLEAN DEFAULT false"),
+    ("attestations", "tlsh_body", "BIT(256)"),
+]
+
+# (table, column, udt_name, statements) — run when the live column has a
+# different type. Dependent indexes are dropped here and recreated from INDEXES.
+COLUMN_TYPES = [
+    ("attestations", "clip_embedding", "halfvec", [
+        "DROP INDEX IF EXISTS ix_attestations_clip_hnsw",
+        "ALTER TABLE attestations ALTER COLUMN clip_embedding TYPE halfvec(512) USING clip_embedding::halfvec(512)",
+    ]),
+]
+
+# SQL for attestations.tlsh_body from tlsh_hash (mirrors db._tlsh_body)
+TLSH_HASH_VALID_SQL = "tlsh_hash ~ '^(T1)?[0-9A-Fa-f]{70}$'"
+TLSH_BODY_SQL = "('x' || right(tlsh_hash, 64))::bit(256)"
+
+# Run once, right after the column is added, to populate existing rows
+BACKFILLS = {
+    ("attestations", "tlsh_body"): (
+        f"UPDATE attestations SET tlsh_body = {TLSH_BODY_SQL} WHERE {TLSH_HASH_VALID_SQL}"
+    ),
+}
+
+# index name → CREATE statement
+INDEXES = {
+    "ix_customers_email": "CREATE UNIQUE INDEX IF NOT EXISTS ix_customers_email ON customers(email) WHERE email IS NOT NULL",
+    "ix_org_api_keys_active": "CREATE INDEX IF NOT EXISTS ix_org_api_keys_active ON org_api_keys(api_key) WHERE revoked = false",
+    # customers.api_key / wallet_pubkey and organizations.domain are already
+    # indexed by their model-level unique constraints
+    "ix_attestations_public_created": "CREATE INDEX IF NOT EXISTS ix_attestations_public_created ON attestations(created_at DESC, id DESC) WHERE private = false",
+    "ix_attestations_submitted_by": "CREATE INDEX IF NOT EXISTS ix_attestations_submitted_by ON attestations(submitted_by) WHERE submitted_by IS NOT NULL",
+    "ix_org_api_keys_org_created": "CREATE INDEX IF NOT EXISTS ix_org_api_keys_org_created ON org_api_keys(org_id, created_at DESC)",
+    # ANN index over binary-quantized CLIP embeddings (pgvector >= 0.7); also declared on the model for new tables
+    "ix_attestations_clip_bq_hnsw": "CREATE INDEX IF NOT EXISTS ix_attestations_clip_bq_hnsw ON attestations USING hnsw ((binary_quantize(clip_embedding)::bit(512)) bit_hamming_ops) WITH (m = 16, ef_construction = 64)",
+}
+
+
+async def run_migrations(conn):
+    """Add missing columns and indexes. Safe to call on every startup."""
+    tables = sorted({t for t, _, _ in COLUMNS} | {t for t, _, _, _ in COLUMN_TYPES})
+    result = await conn.execute(
+        text(
+            "SELECT table_name, column_name, udt_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = ANY(:tables)"
+        ),
+        {"tables": tables},
+    )
+    present = {(t, c): udt for t, c, udt in result}
+    for table, column, ddl in COLUMNS:
+        if (table, column) not in present:
+            await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {ddl}"))
+            if (table, column) in BACKFILLS:
+                await conn.execute(text(BACKFILLS[(table, column)]))
+    for table, column, udt, statements in COLUMN_TYPES:
+        if present.get((table, column), udt) != udt:
+            for sql in statements:
+                await conn.execute(text(sql))
+
+    result = await conn.execute(
+        text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()")
+    )
+    present_indexes = {name for (name,) in result}
+    for name, sql in INDEXES.items():
+        if name not in present_indexes:
+            await conn.execute(text(sql))
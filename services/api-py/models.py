@@ -1,15 +1,36 @@
-from sqlalchemy import BigInteger, Boolean, Column, Integer, String, UniqueConstraint
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from pgvector.sqlalchemy import Vector
+from sqlalchemy import BigInteger, Boolean, Column, Index, Integer, String, text
+from sqlalchemy.dialects.postgresql import BIT
+from sqlalchemy.orm import DeclarativeBase, Mapped, deferred, mapped_column
+from pgvector.sqlalchemy import HALFVEC
 
 
 class Base(DeclarativeBase):
-    pass
+    _column_names: tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._column_names = tuple(c.name for c in cls.__table__.columns)
+
+    def to_dict(self) -> dict:
+        # Loaded column values live in __dict__; unloaded/deferred ones read as None
+        state = self.__dict__
+        return {name: state.get(name) for name in self._column_names}
 
 
 class Attestation(Base):
     __tablename__ = "attestations"
-    __table_args__ = (UniqueConstraint("content_hash"),)
+    # content_hash's btree comes from unique=True below; a second
+    # UniqueConstraint would just build a duplicate index
+    __table_args__ = (
+        # CLIP search ranks candidates by Hamming distance over the
+        # binary-quantized embedding, then re-ranks them by exact cosine
+        Index(
+            "ix_attestations_clip_bq_hnsw",
+            text("(binary_quantize(clip_embedding)::bit(512)) bit_hamming_ops"),
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     content_hash: Mapped[str] = mapped_column(String, nullable=False, unique=True)
@@ -33,7 +54,10 @@ class Attestation(Base):
     verifier_version: Mapped[str | None] = mapped_column(String)
     trust_bundle_hash: Mapped[str | None] = mapped_column(String)
     tlsh_hash: Mapped[str | None] = mapped_column(String)
-    clip_embedding = Column(Vector(512), nullable=True)
+    # Bucket bits of tlsh_hash — SQL-side Hamming prefilter for similarity search
+    tlsh_body = deferred(Column(BIT(256), nullable=True))
+    # ~1 KB per row (float16); only similarity paths load it (undefer / explicit select)
+    clip_embedding = deferred(Column(HALFVEC(512), nullable=True))
     content_type: Mapped[str] = mapped_column(String, nullable=False, default="file")
     source_url: Mapped[str | None] = mapped_column(String)
     mime_type: Mapped[str | None] = mapped_column(String)
@@ -42,17 +66,24 @@ class Attestation(Base):
     private: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
     created_at: Mapped[int] = mapped_column(BigInteger, nullable=False)
 
-    def to_dict(self) -> dict:
-        d = {c.name: getattr(self, c.name) for c in self.__table__.columns}
-        # Convert numpy array to list for JSON serialization
-        if d.get("clip_embedding") is not None:
-            try:
-                d["clip_embedding"] = list(d["clip_embedding"])
-            except TypeError:
-                pass
+    def to_dict(self, include_embedding: bool = False) -> dict:
+        state = self.__dict__
+        names = _ATTESTATION_EMBEDDING_COLUMNS if include_embedding else _ATTESTATION_SUMMARY_COLUMNS
+        d = {name: state.get(name) for name in names}
+        if include_embedding:
+            d["clip_embedding"] = embedding_array(d["clip_embedding"])
         return d
 
 
+def embedding_array(value):
+    """pgvector HalfVector → float16 numpy array, which ORJSONResponse serializes natively."""
+    return value.to_numpy() if value is not None else None
+
+
+_ATTESTATION_EMBEDDING_COLUMNS = tuple(n for n in Attestation._column_names if n != "tlsh_body")
+_ATTESTATION_SUMMARY_COLUMNS = tuple(n for n in _ATTESTATION_EMBEDDING_COLUMNS if n != "clip_embedding")
+
+
 class Customer(Base):
     __tablename__ = "customers"
 
@@ -66,9 +97,6 @@ class Customer(Base):
     privacy_mode: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
     created_at: Mapped[int] = mapped_column(BigInteger, nullable=False)
 
-    def to_dict(self) -> dict:
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
-
 
 class Organization(Base):
     __tablename__ = "organizations"
@@ -83,9 +111,6 @@ class Organization(Base):
     did_web: Mapped[str | None] = mapped_column(String)
     created_at: Mapped[int] = mapped_column(BigInteger, nullable=False)
 
-    def to_dict(self) -> dict:
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
-
 
 class OrgApiKey(Base):
     __tablename__ = "org_api_keys"
@@ -98,5 +123,14 @@ class OrgApiKey(Base):
     created_at: Mapped[int] = mapped_column(BigInteger, nullable=False)
     revoked: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
 
-    def to_dict(self) -> dict:
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+class EmailCode(Base):
+    __tablename__ = "email_codes"
+
+    # scope separates flows that can each have a code pending for one email
+    scope: Mapped[str] = mapped_column(String, primary_key=True)  # "account" | "org"
+    email: Mapped[str] = mapped_column(String, primary_key=True)
+    code: Mapped[str] = mapped_column(String, nullable=False)
+    domain: Mapped[str | None] = mapped_column(String)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    expires_at: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
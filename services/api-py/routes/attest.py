@@ -1,36 +1,121 @@
 import asyncio
-import hashlib
+import logging
+from collections.abc import Awaitable
+from dataclasses import dataclass
 
 import httpx
-from fastapi import APIRouter, File, Form, Header, HTTPException, UploadFile
-from nacl.signing import VerifyKey
-from nacl.exceptions import BadSignatureError
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, UploadFile
 from pydantic import BaseModel
-import base58
+import b58
 
-from config import Settings
-from similarity import compute_tlsh, compute_clip_embedding
-from routes.verify import run_verifier, validate_upload
+from auth import optional_customer
+from sigverify import verify_signature
+from config import Settings, get_settings
+from similarity import ContentHasher, compute_clip_embedding, compute_hashes, should_embed
+from routes.verify import read_upload, run_verifier, validate_upload
 from versioning import VERIFIER_VERSION, compute_trust_bundle_hash
 from solana_tx import (
-    ATTESTATION_SEED,
+    attestation_pda,
     build_and_send_tx,
     create_ed25519_instruction,
     encode_attestation_data,
-    find_pda,
+    fetch_latest_blockhash,
 )
+from http_client import get_http_client
 from storage import get_storage
 import db
 from solana_read import lookup_attestation
-from solders.pubkey import Pubkey
+
+log = logging.getLogger(__name__)
 
 router = APIRouter()
 
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
 
+# String fields of the verifier output, in encode_attestation_data order
+C2PA_STRING_FIELDS = (
+    "trust_list_match", "validation_state", "digital_source_type", "issuer",
+    "common_name", "software_agent", "signing_time", "cert_fingerprint",
+)
+
 
 # ── Shared helper ──────────────────────────────────────────────────
 
+async def fingerprint_content(
+    data: bytes, content_type: str | None, digests: tuple[str, str | None] | None = None,
+) -> tuple[str, str | None, list[float] | None]:
+    """(sha256_hex, tlsh, clip_embedding) for an in-memory payload.
+
+    The fused SHA-256 + TLSH pass and the CLIP embedding read the same buffer
+    from two worker threads at once, instead of one after the other. Pass
+    digests if (sha256_hex, tlsh) are already known to skip the hashing.
+    """
+    ct = (content_type or "").split(";")[0].strip().lower()
+    if digests is not None:
+        clip = await asyncio.to_thread(compute_clip_embedding, data, content_type) if should_embed(ct) else None
+        return digests[0], digests[1], clip
+    if not should_embed(ct):
+        sha256_hex, tlsh_hash = await asyncio.to_thread(compute_hashes, data)
+        return sha256_hex, tlsh_hash, None
+    (sha256_hex, tlsh_hash), clip = await asyncio.gather(
+        asyncio.to_thread(compute_hashes, data),
+        asyncio.to_thread(compute_clip_embedding, data, content_type),
+    )
+    return sha256_hex, tlsh_hash, clip
+
+
+async def wallet_signature_valid(wallet_pubkey: str, wallet_message: str, wallet_signature: str) -> bool:
+    """True if the base58 pubkey/signature pair verifies over wallet_message."""
+    try:
+        pk_bytes = b58.b58decode(wallet_pubkey)
+        sig_bytes = b58.b58decode(wallet_signature)
+    except Exception:
+        return False
+    return await verify_signature(pk_bytes, wallet_message.encode(), sig_bytes)
+
+
+@dataclass
+class FetchedPage:
+    content_hash: str
+    tlsh_hash: str | None
+    content_type: str
+    size: int
+    body: bytes | None  # None when neither storage nor CLIP needs it
+
+
+async def fetch_url(url: str, headers: dict[str, str], keep_body: bool) -> FetchedPage:
+    """Stream a URL through SHA-256 + TLSH, rejecting it once it passes MAX_FILE_SIZE.
+
+    The body is only buffered when keep_body is set or CLIP can embed its content type.
+    """
+    hasher = ContentHasher()
+    buf = bytearray()
+    try:
+        async with get_http_client().stream("GET", url, headers=headers) as resp:
+            resp.raise_for_status()
+            declared = resp.headers.get("content-length", "")
+            if declared.isdigit() and int(declared) > MAX_FILE_SIZE:
+                raise HTTPException(413, "page too large")
+
+            ct = resp.headers.get("content-type", "text/html").split(";")[0].strip()
+            keep = keep_body or should_embed(ct.lower())
+            async for chunk in resp.aiter_bytes():
+                hasher.update(chunk)
+                if hasher.size > MAX_FILE_SIZE:
+                    raise HTTPException(413, "page too large")
+                if keep:
+                    buf += chunk
+    except HTTPException:
+        raise
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(502, f"URL returned {e.response.status_code}")
+    except Exception as e:
+        raise HTTPException(502, f"failed to fetch URL: {e}")
+
+    content_hash, tlsh_hash = hasher.digests()
+    return FetchedPage(content_hash, tlsh_hash, ct, hasher.size, bytes(buf) if keep else None)
+
+
 async def _submit_attestation(
     *,
     settings: Settings,
@@ -48,16 +133,42 @@ async def _submit_attestation(
     wallet_signature: str | None = None,
     privacy_mode: bool = False,
     private_mode: bool = False,
+    wallet_verified: bool | None = None,
 ) -> dict:
-    """Shared attestation: PDA derivation, idempotency, wallet verification, Solana tx, DB insert."""
+    """Shared attestation: PDA derivation, idempotency, wallet verification, Solana tx, DB insert.
+
+    wallet_verified is the caller's result for this exact (pubkey, message,
+    signature) triple, if it already checked it: True skips the off-chain
+    verify, False rejects without re-verifying. None verifies here.
+    """
     content_hash = bytes.fromhex(content_hash_hex)
-    program_id = Pubkey.from_string(settings.program_id)
-    pda, _ = find_pda([ATTESTATION_SEED, content_hash], program_id)
+    pda = attestation_pda(settings.program_id, content_hash)
 
-    # Idempotency
-    existing = await asyncio.to_thread(
-        lookup_attestation, settings.solana_rpc_url, settings.program_id, content_hash_hex
-    )
+    # Idempotency — Postgres first (unique content_hash); a private-only row
+    # doesn't block a later on-chain attestation of the same content
+    row = await db.get_attestation(content_hash_hex)
+    if row and (row["pda"] or private_mode):
+        return {
+            "signature": row["tx_signature"],
+            "attestation_pda": row["pda"],
+            "content_hash": content_hash_hex,
+            "verify_output": verify_output,
+            "existing": True,
+        }
+
+    # On-chain attestations the DB doesn't know about (e.g. after a DB reset).
+    # A tx will follow unless this returns early, so its blockhash is fetched
+    # in the same round-trip window.
+    existing = None
+    blockhash = None
+    if settings.check_chain_idempotency:
+        lookup = lookup_attestation(settings.solana_rpc_url, settings.program_id, content_hash_hex)
+        if private_mode:
+            existing = await lookup
+        else:
+            existing, blockhash = await asyncio.gather(
+                lookup, fetch_latest_blockhash(settings.solana_rpc_url)
+            )
     if existing:
         return {
             "signature": None,
@@ -78,17 +189,24 @@ async def _submit_attestation(
         if content_hash_hex not in wallet_message:
             raise HTTPException(400, "wallet message must contain the content hash")
         try:
-            pk_bytes = base58.b58decode(wallet_pubkey)
-            sig_bytes = base58.b58decode(wallet_signature)
+            pk_bytes = b58.b58decode(wallet_pubkey)
+            sig_bytes = b58.b58decode(wallet_signature)
         except Exception:
             raise HTTPException(400, "invalid base58 encoding")
         if len(pk_bytes) != 32:
             raise HTTPException(400, "invalid wallet pubkey length")
-        try:
-            verify_key = VerifyKey(pk_bytes)
-            verify_key.verify(wallet_message.encode(), sig_bytes)
-        except BadSignatureError:
+        if len(sig_bytes) != 64:
+            raise HTTPException(400, "invalid wallet signature length")
+        # The Ed25519 precompile re-verifies the signature whenever its
+        # instruction is sent, failing the tx atomically on a bad signature
+        precompile_verifies = (
+            settings.skip_offchain_ed25519_verify and not (private_mode or privacy_mode)
+        )
+        if wallet_verified is False:
             raise HTTPException(400, "invalid wallet signature")
+        if not (wallet_verified or precompile_verifies):
+            if not await verify_signature(pk_bytes, wallet_message.encode(), sig_bytes):
+                raise HTTPException(400, "invalid wallet signature")
         wallet_bytes = pk_bytes
         resolved_wallet = wallet_pubkey
         ed25519_ix = create_ed25519_instruction(pk_bytes, sig_bytes, wallet_message.encode())
@@ -103,6 +221,10 @@ async def _submit_attestation(
     # Versioning
     trust_hash = compute_trust_bundle_hash(settings.trust_dir)
 
+    # Verifier fields, shared by the on-chain instruction and the DB row
+    c2pa = {"has_c2pa": verify_output.get("has_c2pa", False)}
+    c2pa.update((name, verify_output.get(name) or "") for name in C2PA_STRING_FIELDS)
+
     sig = None
     pda_str = str(pda)
 
@@ -111,15 +233,7 @@ async def _submit_attestation(
         # Encode instruction
         ix_data = encode_attestation_data(
             content_hash=content_hash,
-            has_c2pa=verify_output.get("has_c2pa", False),
-            trust_list_match=verify_output.get("trust_list_match") or "",
-            validation_state=verify_output.get("validation_state") or "",
-            digital_source_type=verify_output.get("digital_source_type") or "",
-            issuer=verify_output.get("issuer") or "",
-            common_name=verify_output.get("common_name") or "",
-            software_agent=verify_output.get("software_agent") or "",
-            signing_time=verify_output.get("signing_time") or "",
-            cert_fingerprint=verify_output.get("cert_fingerprint") or "",
+            **c2pa,
             email_domain=email_domain,
             email_hash=email_hash,
             wallet=wallet_bytes,
@@ -129,8 +243,7 @@ async def _submit_attestation(
 
         # Send Solana tx
         extra_ixs = [ed25519_ix] if ed25519_ix else None
-        sig, pda_str = await asyncio.to_thread(
-            build_and_send_tx,
+        sig, pda_str = await build_and_send_tx(
             settings.solana_rpc_url,
             settings.solana_keypair_path,
             settings.program_id,
@@ -138,6 +251,7 @@ async def _submit_attestation(
             pda,
             200_000,
             extra_ixs,
+            blockhash,
         )
 
     # DB insert
@@ -145,15 +259,7 @@ async def _submit_attestation(
         content_hash=content_hash_hex,
         tx_signature=sig,
         pda=pda_str if not private_mode else None,
-        has_c2pa=verify_output.get("has_c2pa", False),
-        trust_list_match=verify_output.get("trust_list_match") or "",
-        validation_state=verify_output.get("validation_state") or "",
-        digital_source_type=verify_output.get("digital_source_type") or "",
-        issuer=verify_output.get("issuer") or "",
-        common_name=verify_output.get("common_name") or "",
-        software_agent=verify_output.get("software_agent") or "",
-        signing_time=verify_output.get("signing_time") or "",
-        cert_fingerprint=verify_output.get("cert_fingerprint") or "",
+        **c2pa,
         email_domain=email_domain or None,
         wallet_pubkey=resolved_wallet,
         verifier_version=VERIFIER_VERSION,
@@ -180,6 +286,31 @@ async def _submit_attestation(
     return result
 
 
+async def submit_with_storage(storage_save: Awaitable[None] | None, **kwargs) -> dict:
+    """_submit_attestation with the content upload running in the background.
+
+    The upload overlaps the Solana lookup/tx and is awaited before returning.
+    If it fails, the attestation still stands and its row is marked stored=false.
+    """
+    if storage_save is None:
+        return await _submit_attestation(stored=False, **kwargs)
+
+    storage_task = asyncio.create_task(storage_save)
+    try:
+        result = await _submit_attestation(stored=True, **kwargs)
+    except BaseException:
+        await asyncio.gather(storage_task, return_exceptions=True)
+        raise
+
+    try:
+        await storage_task
+    except Exception:
+        log.exception("content upload failed for %s", kwargs["content_hash_hex"])
+        if not result.get("existing"):
+            await db.set_attestation_stored(kwargs["content_hash_hex"], False)
+    return result
+
+
 # ── POST /api/attest (file upload) ────────────────────────────────
 
 @router.post("/attest")
@@ -191,33 +322,38 @@ async def attest(
     wallet_message: str = Form(None),
     wallet_signature: str = Form(None),
     x_api_key: str | None = Header(None),
+    settings: Settings = Depends(get_settings),
 ):
-    settings = Settings()
-    caller = await db.get_customer_by_api_key(x_api_key) if x_api_key else None
-    file_bytes = await file.read()
+    caller = await optional_customer(x_api_key)
+    # TLSH is computed while the upload is read; oversized files are
+    # rejected before the rest of the body is buffered
+    hasher = ContentHasher()
+    file_bytes = await read_upload(file, hasher)
     validate_upload(file_bytes, file.content_type)
+    _, file_tlsh = hasher.digests()
 
-    # Compute similarity hashes
-    file_tlsh = compute_tlsh(file_bytes)
-    file_clip = compute_clip_embedding(file_bytes, file.content_type)
-
-    # Verify file (C2PA extraction)
-    verify_output = await run_verifier(file_bytes, file.filename or "upload", settings)
+    # CLIP (worker thread) and C2PA verification (subprocess) run
+    # concurrently; the content hash comes from the verifier
+    file_clip, verify_output = await asyncio.gather(
+        asyncio.to_thread(compute_clip_embedding, file_bytes, file.content_type),
+        run_verifier(file_bytes, file.filename or "upload", settings),
+    )
 
     content_hash_hex = verify_output.get("content_hash")
     if not content_hash_hex:
         raise HTTPException(500, "no content hash from verifier")
 
-    # Store content
+    # Store content (uploaded while the attestation is submitted)
     should_store = store_content.lower() not in ("false", "0", "no")
+    storage_save = None
     if should_store:
-        storage = get_storage()
         ct = file.content_type or "application/octet-stream"
-        await storage.save(content_hash_hex, file_bytes, ct)
+        storage_save = get_storage().save(content_hash_hex, file_bytes, ct)
 
     is_private = private_mode.lower() not in ("false", "0", "no")
 
-    return await _submit_attestation(
+    return await submit_with_storage(
+        storage_save,
         settings=settings,
         content_hash_hex=content_hash_hex,
         verify_output=verify_output,
@@ -226,7 +362,6 @@ async def attest(
         content_type="file",
         mime_type=file.content_type,
         content_size=len(file_bytes),
-        stored=should_store,
         wallet_pubkey=wallet_pubkey,
         wallet_message=wallet_message,
         wallet_signature=wallet_signature,
@@ -245,40 +380,29 @@ class AttestUrlRequest(BaseModel):
 
 
 @router.post("/attest/url")
-async def attest_url(req: AttestUrlRequest, x_api_key: str | None = Header(None)):
-    settings = Settings()
-    caller = await db.get_customer_by_api_key(x_api_key) if x_api_key else None
+async def attest_url(
+    req: AttestUrlRequest,
+    x_api_key: str | None = Header(None),
+    settings: Settings = Depends(get_settings),
+):
+    caller = await optional_customer(x_api_key)
 
     # Build fetch headers — always include User-Agent, merge caller-provided headers
     fetch_headers = {"User-Agent": "R3L-Attester/1.0"}
     if req.headers:
         fetch_headers.update(req.headers)
 
-    # Fetch URL
-    try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=30) as client:
-            resp = await client.get(req.url, headers=fetch_headers)
-            resp.raise_for_status()
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(502, f"URL returned {e.response.status_code}")
-    except Exception as e:
-        raise HTTPException(502, f"failed to fetch URL: {e}")
-
-    page_bytes = resp.content
-    if len(page_bytes) > MAX_FILE_SIZE:
-        raise HTTPException(413, "page too large")
-
-    content_type_header = resp.headers.get("content-type", "text/html").split(";")[0].strip()
-
-    # Hash + similarity
-    content_hash_hex = hashlib.sha256(page_bytes).hexdigest()
-    file_tlsh = compute_tlsh(page_bytes)
-    file_clip = compute_clip_embedding(page_bytes, content_type_header)
+    # Fetch URL, hashing as it streams in
+    page = await fetch_url(req.url, fetch_headers, keep_body=req.store_content)
+    content_hash_hex = page.content_hash
+    file_clip = None
+    if page.body is not None:
+        file_clip = await asyncio.to_thread(compute_clip_embedding, page.body, page.content_type)
 
-    # Store
+    # Store (uploaded while the attestation is submitted)
+    storage_save = None
     if req.store_content:
-        storage = get_storage()
-        await storage.save(content_hash_hex, page_bytes, content_type_header)
+        storage_save = get_storage().save(content_hash_hex, page.body, page.content_type)
 
     # No C2PA for URLs
     verify_output = {
@@ -286,17 +410,17 @@ async def attest_url(req: AttestUrlRequest, x_api_key: str | None = Header(None)
         "has_c2pa": False,
     }
 
-    return await _submit_attestation(
+    return await submit_with_storage(
+        storage_save,
         settings=settings,
         content_hash_hex=content_hash_hex,
         verify_output=verify_output,
-        tlsh_hash=file_tlsh,
+        tlsh_hash=page.tlsh_hash,
         clip_embedding=file_clip,
         content_type="url",
         source_url=req.url,
-        mime_type=content_type_header,
-        content_size=len(page_bytes),
-        stored=req.store_content,
+        mime_type=page.content_type,
+        content_size=page.size,
         privacy_mode=caller.get("privacy_mode", False) if caller else False,
         private_mode=req.private_mode,
     )
@@ -312,28 +436,30 @@ class AttestTextRequest(BaseModel):
 
 
 @router.post("/attest/text")
-async def attest_text(req: AttestTextRequest, x_api_key: str | None = Header(None)):
-    settings = Settings()
-    caller = await db.get_customer_by_api_key(x_api_key) if x_api_key else None
+async def attest_text(
+    req: AttestTextRequest,
+    x_api_key: str | None = Header(None),
+    settings: Settings = Depends(get_settings),
+):
+    caller = await optional_customer(x_api_key)
 
     text_bytes = req.text.encode("utf-8")
     if len(text_bytes) > MAX_FILE_SIZE:
         raise HTTPException(413, "text too large")
 
-    content_hash_hex = hashlib.sha256(text_bytes).hexdigest()
-    file_tlsh = compute_tlsh(text_bytes)
-    file_clip = compute_clip_embedding(text_bytes, "text/plain")
+    content_hash_hex, file_tlsh, file_clip = await fingerprint_content(text_bytes, "text/plain")
 
+    storage_save = None
     if req.store_content:
-        storage = get_storage()
-        await storage.save(content_hash_hex, text_bytes, "text/plain")
+        storage_save = get_storage().save(content_hash_hex, text_bytes, "text/plain")
 
     verify_output = {
         "content_hash": content_hash_hex,
         "has_c2pa": False,
     }
 
-    return await _submit_attestation(
+    return await submit_with_storage(
+        storage_save,
         settings=settings,
         content_hash_hex=content_hash_hex,
         verify_output=verify_output,
@@ -342,7 +468,6 @@ async def attest_text(req: AttestTextRequest, x_api_key: str | None = Header(Non
         content_type="text",
         mime_type="text/plain",
         content_size=len(text_bytes),
-        stored=req.store_content,
         privacy_mode=caller.get("privacy_mode", False) if caller else False,
         private_mode=req.private_mode,
     )
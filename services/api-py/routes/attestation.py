@@ -1,16 +1,18 @@
-import asyncio
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 
-from fastapi import APIRouter, HTTPException
-
-from config import Settings
+from config import Settings, get_settings
 import db
 from solana_read import lookup_attestation
 
 router = APIRouter()
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
 
 @router.get("/attestation/{hash}")
-async def lookup(hash: str):
+async def lookup(hash: str, settings: Settings = Depends(get_settings)):
     # Try DB first
     row = await db.get_attestation(hash)
     if row and row.get("private", False):
@@ -52,18 +54,24 @@ async def lookup(hash: str):
         return result
 
     # Fall back to on-chain lookup
-    settings = Settings()
-    result = await asyncio.to_thread(
-        lookup_attestation, settings.solana_rpc_url, settings.program_id, hash
-    )
+    result = await lookup_attestation(settings.solana_rpc_url, settings.program_id, hash)
     if result is None:
         raise HTTPException(404, "attestation not found")
     return result
 
 
 @router.get("/attestations")
-async def list_all():
-    rows = await db.list_attestations()
+async def list_all(include_embedding: bool = False, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = None
+    if cursor:
+        try:
+            created_at, _, row_id = cursor.partition(":")
+            after = (int(created_at), int(row_id))
+        except ValueError:
+            raise HTTPException(400, "invalid cursor")
+
+    rows = await db.list_attestations(include_embedding=include_embedding, limit=limit, after=after)
     items = []
     for row in rows:
         item = {
@@ -85,5 +93,10 @@ async def list_all():
         if row.get("source_url"):
             item["source_url"] = row["source_url"]
         item["stored"] = row.get("stored", False)
+        if include_embedding:
+            item["clip_embedding"] = row["clip_embedding"]
         items.append(item)
-    return items
+
+    next_cursor = f"{rows[-1]['created_at']}:{rows[-1]['id']}" if len(rows) == limit else None
+    # Returned directly so the numpy embeddings skip jsonable_encoder
+    return ORJSONResponse({"items": items, "next_cursor": next_cursor})
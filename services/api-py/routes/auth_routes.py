@@ -1,27 +1,38 @@
-import asyncio
-import random
+import re
 import secrets
-import smtplib
-import string
+import time
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
-from email.mime.text import MIMEText
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from pydantic import BaseModel
-from nacl.signing import VerifyKey
-from nacl.exceptions import BadSignatureError
-import base58
+import b58
 
 import db
-from auth import require_api_key
-from config import Settings
+from auth import invalidate_api_key, require_api_key
+from config import Settings, get_settings
+from did import get_all_dids_for_org
+from sigverify import verify_signature
+from mailer import code_email, send_email_logged, verification_template
+from ttl_store import ExpiringStore
 
 router = APIRouter()
 
-EXPIRY = timedelta(minutes=30)
+EXPIRY_S = 30 * 60
 MAX_ATTEMPTS = 5
-CHALLENGE_EXPIRY = timedelta(minutes=5)
+EMAIL_CODE_SCOPE = "account"  # email_codes.scope for account signup/link codes
+CHALLENGE_EXPIRY_S = 5 * 60
+CHALLENGE_PREFIX = b"R3L-auth:"
+
+# Base58 lengths of 32- and 64-byte values; each leading zero byte encodes
+# as a single "1", so the short end is reachable, just rare
+PUBKEY_B58_LEN = range(32, 45)
+SIGNATURE_B58_LEN = range(64, 89)
+
+# local@domain.tld — one pass instead of separate "@", "." and length checks
+_EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]{2,}")
+
+_SIGNUP_EMAIL = verification_template("Verify your email to create your account.")
+_LINK_EMAIL = verification_template("Verify your email to link it to your account.")
 
 
 # ── Helpers ──────────────────────────────────────────────────────────
@@ -31,47 +42,88 @@ def _generate_api_key() -> str:
 
 
 def _generate_code() -> str:
-    return "".join(random.choices(string.digits, k=6))
-
-
-def _send_email(settings: Settings, msg: MIMEText):
-    with smtplib.SMTP_SSL(settings.smtp_host, 465) as server:
-        server.login(settings.smtp_user, settings.smtp_pass)
-        server.send_message(msg)
+    return f"{secrets.randbelow(1_000_000):06d}"
 
 
 # ── In-memory stores ────────────────────────────────────────────────
 
-@dataclass
-class EmailCode:
-    email: str
-    code: str
-    attempts: int = 0
-    created_at: datetime = field(default_factory=datetime.now)
-
-
 @dataclass
 class WalletChallenge:
     nonce: str
-    created_at: datetime = field(default_factory=datetime.now)
+    created_at: float = field(default_factory=time.monotonic)
+
+
+_wallet_challenges = ExpiringStore(CHALLENGE_EXPIRY_S)  # keyed by nonce
+
 
+# ── Email codes ─────────────────────────────────────────────────────
 
-_email_codes: dict[str, EmailCode] = {}  # keyed by lowercase email
-_wallet_challenges: dict[str, WalletChallenge] = {}  # keyed by nonce
+async def _issue_email_code(email: str, scope: str = EMAIL_CODE_SCOPE, domain: str | None = None) -> str:
+    """Generate a code for email, replacing any pending one in the same scope."""
+    code = _generate_code()
+    await db.put_email_code(scope, email, code, EXPIRY_S, domain)
+    return code
+
+
+async def _consume_email_code(email: str, code: str, scope: str = EMAIL_CODE_SCOPE) -> dict:
+    """Check a submitted code and consume it on success, counting failed attempts.
+
+    Codes live in Postgres and the check holds the code's row lock, so any
+    worker can verify a code another issued and MAX_ATTEMPTS holds across
+    them. Returns the consumed code's row (org codes carry their domain).
+    """
+    outcome, entry = await db.check_email_code(scope, email, code, MAX_ATTEMPTS)
 
+    if outcome == "missing":
+        raise HTTPException(404, "no verification pending for this email")
+
+    if outcome == "expired":
+        raise HTTPException(410, "code expired \u2014 request a new code")
 
-def _clean_expired_emails():
-    now = datetime.now()
-    expired = [k for k, v in _email_codes.items() if now - v.created_at > EXPIRY]
-    for k in expired:
-        del _email_codes[k]
+    if outcome == "exhausted":
+        raise HTTPException(429, "too many attempts \u2014 request a new code")
+
+    if outcome == "wrong":
+        remaining = MAX_ATTEMPTS - entry["attempts"]
+        raise HTTPException(
+            400,
+            f"invalid code \u2014 {remaining} attempt{'s' if remaining != 1 else ''} remaining",
+        )
 
+    return entry
 
-def _clean_expired_challenges():
-    now = datetime.now()
-    expired = [k for k, v in _wallet_challenges.items() if now - v.created_at > CHALLENGE_EXPIRY]
-    for k in expired:
-        del _wallet_challenges[k]
+
+def _consume_challenge(message: bytes):
+    """Check an "R3L-auth:<nonce>" message and consume its nonce.
+
+    Single use: the nonce is dropped even if signature verification fails.
+    """
+    if not message.startswith(CHALLENGE_PREFIX):
+        raise HTTPException(400, "invalid challenge format")
+    nonce = message[len(CHALLENGE_PREFIX):].decode()
+
+    challenge = _wallet_challenges.pop(nonce)
+    if not challenge:
+        raise HTTPException(400, "invalid or expired challenge")
+    if time.monotonic() - challenge.created_at > CHALLENGE_EXPIRY_S:
+        raise HTTPException(400, "challenge expired")
+
+
+async def _verify_wallet_signature(pubkey: str, message: bytes, signature: str):
+    """Raise 400 unless signature is pubkey's Ed25519 signature over message."""
+    if not (len(pubkey) in PUBKEY_B58_LEN and len(signature) in SIGNATURE_B58_LEN):
+        raise HTTPException(400, "invalid encoding length")
+    try:
+        pubkey_bytes = b58.b58decode(pubkey)
+        sig_bytes = b58.b58decode(signature)
+    except Exception:
+        raise HTTPException(400, "invalid base58 encoding")
+
+    if len(pubkey_bytes) != 32:
+        raise HTTPException(400, "invalid pubkey length")
+
+    if not await verify_signature(pubkey_bytes, message, sig_bytes):
+        raise HTTPException(400, "invalid signature")
 
 
 # ── Request models ──────────────────────────────────────────────────
@@ -95,44 +147,23 @@ class WalletVerifyRequest(BaseModel):
 # ── POST /api/auth/email/start ──────────────────────────────────────
 
 @router.post("/email/start")
-async def email_start(req: EmailStartRequest):
+async def email_start(
+    req: EmailStartRequest,
+    background_tasks: BackgroundTasks,
+    settings: Settings = Depends(get_settings),
+):
     email = req.email.lower().strip()
-    if "@" not in email:
+    if not _EMAIL_RE.fullmatch(email):
         raise HTTPException(400, "invalid email")
 
-    domain = email.split("@", 1)[1]
-    if "." not in domain or len(domain) < 3:
-        raise HTTPException(400, "invalid email domain")
-
-    _clean_expired_emails()
-    code = _generate_code()
-    _email_codes[email] = EmailCode(email=email, code=code)
+    code = await _issue_email_code(email)
 
-    settings = Settings()
     resp = {"status": "pending", "email": email}
 
     if settings.smtp_host:
-        html_body = f"""<!DOCTYPE html>
-<html><head><meta charset="utf-8"></head>
-<body style="font-family:system-ui,sans-serif;background:#0a0a0f;color:#e5e5e5;margin:0;padding:40px;">
-<div style="max-width:480px;margin:0 auto;background:#1a1a2e;border:1px solid #2d2d44;border-radius:12px;padding:40px;text-align:center;">
-<h1 style="color:#facc15;margin:0 0 8px;font-size:24px;">R3L Provenance</h1>
-<p style="color:#9ca3af;margin:0 0 24px;">Verify your email to create your account.</p>
-<p style="color:#e5e5e5;margin:0 0 8px;">Your verification code:</p>
-<p style="font-size:36px;font-weight:700;color:#facc15;letter-spacing:8px;margin:0 0 24px;">{code}</p>
-<p style="color:#6b7280;font-size:12px;margin:0;">This code expires in 30 minutes.</p>
-</div>
-</body></html>"""
-        from_addr = settings.smtp_from or settings.smtp_user
-        msg = MIMEText(html_body, "html")
-        msg["Subject"] = "R3L \u2014 Your verification code"
-        msg["From"] = from_addr
-        msg["To"] = email
-
-        try:
-            await asyncio.to_thread(_send_email, settings, msg)
-        except Exception as e:
-            raise HTTPException(500, f"failed to send email: {e}")
+        msg = code_email(settings, _SIGNUP_EMAIL, code, "R3L \u2014 Your verification code", email)
+        # Sent after the response goes out; failures are logged
+        background_tasks.add_task(send_email_logged, settings, msg)
     else:
         resp["dev_code"] = code
 
@@ -144,31 +175,7 @@ async def email_start(req: EmailStartRequest):
 @router.post("/email/verify")
 async def email_verify(req: EmailVerifyRequest):
     email = req.email.lower().strip()
-    entry = _email_codes.get(email)
-
-    if not entry:
-        raise HTTPException(404, "no verification pending for this email")
-
-    if datetime.now() - entry.created_at > EXPIRY:
-        del _email_codes[email]
-        raise HTTPException(410, "code expired \u2014 request a new code")
-
-    if entry.attempts >= MAX_ATTEMPTS:
-        del _email_codes[email]
-        raise HTTPException(429, "too many attempts \u2014 request a new code")
-
-    if entry.code != req.code:
-        entry.attempts += 1
-        remaining = MAX_ATTEMPTS - entry.attempts
-        if remaining <= 0:
-            del _email_codes[email]
-            raise HTTPException(429, "too many attempts \u2014 request a new code")
-        raise HTTPException(
-            400,
-            f"invalid code \u2014 {remaining} attempt{'s' if remaining != 1 else ''} remaining",
-        )
-
-    del _email_codes[email]
+    await _consume_email_code(email, req.code)
 
     # Check if email already has an account — return existing key
     existing = await db.get_customer_by_email(email)
@@ -198,12 +205,11 @@ async def email_verify(req: EmailVerifyRequest):
 
 @router.get("/wallet/challenge")
 async def wallet_challenge():
-    _clean_expired_challenges()
     nonce = secrets.token_hex(16)
-    _wallet_challenges[nonce] = WalletChallenge(nonce=nonce)
+    _wallet_challenges.put(nonce, WalletChallenge(nonce=nonce))
     return {
         "challenge": f"R3L-auth:{nonce}",
-        "expires_in": 300,
+        "expires_in": CHALLENGE_EXPIRY_S,
     }
 
 
@@ -211,35 +217,9 @@ async def wallet_challenge():
 
 @router.post("/wallet/verify")
 async def wallet_verify(req: WalletVerifyRequest):
-    # Validate message format
-    if not req.message.startswith("R3L-auth:"):
-        raise HTTPException(400, "invalid challenge format")
-    nonce = req.message.split(":", 1)[1]
-
-    # Check nonce
-    challenge = _wallet_challenges.get(nonce)
-    if not challenge:
-        raise HTTPException(400, "invalid or expired challenge")
-    if datetime.now() - challenge.created_at > CHALLENGE_EXPIRY:
-        del _wallet_challenges[nonce]
-        raise HTTPException(400, "challenge expired")
-    del _wallet_challenges[nonce]  # single use
-
-    # Verify Ed25519 signature
-    try:
-        pubkey_bytes = base58.b58decode(req.pubkey)
-        sig_bytes = base58.b58decode(req.signature)
-    except Exception:
-        raise HTTPException(400, "invalid base58 encoding")
-
-    if len(pubkey_bytes) != 32:
-        raise HTTPException(400, "invalid pubkey length")
-
-    try:
-        verify_key = VerifyKey(pubkey_bytes)
-        verify_key.verify(req.message.encode(), sig_bytes)
-    except BadSignatureError:
-        raise HTTPException(400, "invalid signature")
+    message = req.message.encode()  # signed bytes; encoded once
+    _consume_challenge(message)
+    await _verify_wallet_signature(req.pubkey, message, req.signature)
 
     # Check if wallet already has an account — return existing key
     existing = await db.get_customer_by_wallet(req.pubkey)
@@ -272,7 +252,6 @@ async def get_me(caller: dict = Depends(require_api_key)):
     """Unified identity endpoint for any auth type."""
     if caller.get("type") == "org":
         org = await db.get_organization_by_id(caller["org_id"])
-        from did import get_all_dids_for_org
         dids = get_all_dids_for_org(org) if org else {}
         return {
             "type": "org",
@@ -304,55 +283,36 @@ async def update_privacy_mode(req: PrivacyModeRequest, caller: dict = Depends(re
     if caller.get("type") == "org":
         raise HTTPException(400, "privacy mode is only available for individual accounts")
     updated = await db.update_customer_privacy_mode(caller["id"], req.privacy_mode)
+    invalidate_api_key(caller["api_key"])
     return {"privacy_mode": updated["privacy_mode"]}
 
 
 # ── POST /api/auth/link/email/start ──────────────────────────────
 
 @router.post("/link/email/start")
-async def link_email_start(req: EmailStartRequest, caller: dict = Depends(require_api_key)):
+async def link_email_start(
+    req: EmailStartRequest,
+    background_tasks: BackgroundTasks,
+    caller: dict = Depends(require_api_key),
+    settings: Settings = Depends(get_settings),
+):
     if caller.get("email"):
         raise HTTPException(400, "email already linked to this account")
 
     email = req.email.lower().strip()
-    if "@" not in email:
+    if not _EMAIL_RE.fullmatch(email):
         raise HTTPException(400, "invalid email")
 
-    domain = email.split("@", 1)[1]
-    if "." not in domain or len(domain) < 3:
-        raise HTTPException(400, "invalid email domain")
-
     # Allow even if email belongs to another account — merge happens at verify time
 
-    _clean_expired_emails()
-    code = _generate_code()
-    _email_codes[email] = EmailCode(email=email, code=code)
+    code = await _issue_email_code(email)
 
-    settings = Settings()
     resp = {"status": "pending", "email": email}
 
     if settings.smtp_host:
-        html_body = f"""<!DOCTYPE html>
-<html><head><meta charset="utf-8"></head>
-<body style="font-family:system-ui,sans-serif;background:#0a0a0f;color:#e5e5e5;margin:0;padding:40px;">
-<div style="max-width:480px;margin:0 auto;background:#1a1a2e;border:1px solid #2d2d44;border-radius:12px;padding:40px;text-align:center;">
-<h1 style="color:#facc15;margin:0 0 8px;font-size:24px;">R3L Provenance</h1>
-<p style="color:#9ca3af;margin:0 0 24px;">Verify your email to link it to your account.</p>
-<p style="color:#e5e5e5;margin:0 0 8px;">Your verification code:</p>
-<p style="font-size:36px;font-weight:700;color:#facc15;letter-spacing:8px;margin:0 0 24px;">{code}</p>
-<p style="color:#6b7280;font-size:12px;margin:0;">This code expires in 30 minutes.</p>
-</div>
-</body></html>"""
-        from_addr = settings.smtp_from or settings.smtp_user
-        msg = MIMEText(html_body, "html")
-        msg["Subject"] = "R3L \u2014 Link your email"
-        msg["From"] = from_addr
-        msg["To"] = email
-
-        try:
-            await asyncio.to_thread(_send_email, settings, msg)
-        except Exception as e:
-            raise HTTPException(500, f"failed to send email: {e}")
+        msg = code_email(settings, _LINK_EMAIL, code, "R3L \u2014 Link your email", email)
+        # Sent after the response goes out; failures are logged
+        background_tasks.add_task(send_email_logged, settings, msg)
     else:
         resp["dev_code"] = code
 
@@ -367,31 +327,7 @@ async def link_email_verify(req: EmailVerifyRequest, caller: dict = Depends(requ
         raise HTTPException(400, "email already linked to this account")
 
     email = req.email.lower().strip()
-    entry = _email_codes.get(email)
-
-    if not entry:
-        raise HTTPException(404, "no verification pending for this email")
-
-    if datetime.now() - entry.created_at > EXPIRY:
-        del _email_codes[email]
-        raise HTTPException(410, "code expired \u2014 request a new code")
-
-    if entry.attempts >= MAX_ATTEMPTS:
-        del _email_codes[email]
-        raise HTTPException(429, "too many attempts \u2014 request a new code")
-
-    if entry.code != req.code:
-        entry.attempts += 1
-        remaining = MAX_ATTEMPTS - entry.attempts
-        if remaining <= 0:
-            del _email_codes[email]
-            raise HTTPException(429, "too many attempts \u2014 request a new code")
-        raise HTTPException(
-            400,
-            f"invalid code \u2014 {remaining} attempt{'s' if remaining != 1 else ''} remaining",
-        )
-
-    del _email_codes[email]
+    await _consume_email_code(email, req.code)
 
     # Check if email belongs to another account — merge if so
     existing = await db.get_customer_by_email(email)
@@ -400,9 +336,15 @@ async def link_email_verify(req: EmailVerifyRequest, caller: dict = Depends(requ
             return {"status": "linked", "email": email}
         # User proved ownership of both accounts — merge them
         merged = await db.merge_customers(keep_id=caller["id"], remove_id=existing["id"])
+        invalidate_api_key(caller["api_key"], existing["api_key"])
         return {"status": "merged", "email": email}
 
-    await db.link_email_to_customer(caller["id"], email)
+    try:
+        await db.link_email_to_customer(caller["id"], email)
+    except db.EmailTaken:
+        # Claimed by another account since the lookup above
+        raise HTTPException(409, "email is linked to another account")
+    invalidate_api_key(caller["api_key"])
     return {"status": "linked", "email": email}
 
 
@@ -413,35 +355,10 @@ async def link_wallet(req: WalletVerifyRequest, caller: dict = Depends(require_a
     if caller.get("wallet_pubkey"):
         raise HTTPException(400, "wallet already linked to this account")
 
-    # Validate message format (reuse same challenge)
-    if not req.message.startswith("R3L-auth:"):
-        raise HTTPException(400, "invalid challenge format")
-    nonce = req.message.split(":", 1)[1]
-
-    # Check nonce
-    challenge = _wallet_challenges.get(nonce)
-    if not challenge:
-        raise HTTPException(400, "invalid or expired challenge")
-    if datetime.now() - challenge.created_at > CHALLENGE_EXPIRY:
-        del _wallet_challenges[nonce]
-        raise HTTPException(400, "challenge expired")
-    del _wallet_challenges[nonce]
-
-    # Verify Ed25519 signature
-    try:
-        pubkey_bytes = base58.b58decode(req.pubkey)
-        sig_bytes = base58.b58decode(req.signature)
-    except Exception:
-        raise HTTPException(400, "invalid base58 encoding")
-
-    if len(pubkey_bytes) != 32:
-        raise HTTPException(400, "invalid pubkey length")
-
-    try:
-        verify_key = VerifyKey(pubkey_bytes)
-        verify_key.verify(req.message.encode(), sig_bytes)
-    except BadSignatureError:
-        raise HTTPException(400, "invalid signature")
+    # Reuses the login challenge
+    message = req.message.encode()  # signed bytes; encoded once
+    _consume_challenge(message)
+    await _verify_wallet_signature(req.pubkey, message, req.signature)
 
     # Check if wallet belongs to another account — merge if so
     existing = await db.get_customer_by_wallet(req.pubkey)
@@ -450,7 +367,9 @@ async def link_wallet(req: WalletVerifyRequest, caller: dict = Depends(require_a
             return {"status": "linked", "wallet_pubkey": req.pubkey}
         # User proved ownership of both accounts — merge them
         merged = await db.merge_customers(keep_id=caller["id"], remove_id=existing["id"])
+        invalidate_api_key(caller["api_key"], existing["api_key"])
         return {"status": "merged", "wallet_pubkey": req.pubkey}
 
     await db.link_wallet_to_customer(caller["id"], req.pubkey)
+    invalidate_api_key(caller["api_key"])
     return {"status": "linked", "wallet_pubkey": req.pubkey}
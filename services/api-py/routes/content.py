@@ -1,25 +1,48 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import Response
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 
 from storage import get_storage
 import db
 
 router = APIRouter()
 
+# Content is addressed by its SHA-256, so a stored blob never changes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag in tags
+
 
 @router.get("/content/{content_hash}")
-async def get_content(content_hash: str):
+async def get_content(content_hash: str, request: Request):
     """Retrieve stored content by its SHA-256 hash."""
-    att = await db.get_attestation(content_hash)
-    if not att:
-        raise HTTPException(404, "attestation not found")
-    if not att.get("stored"):
-        raise HTTPException(404, "content not stored for this attestation")
-
-    storage = get_storage()
-    result = await storage.get(content_hash)
+    cache_headers = {"ETag": f'"{content_hash}"', "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match", ""), cache_headers["ETag"]):
+        return Response(status_code=304, headers=cache_headers)
+
+    # Start the storage fetch alongside the DB lookup
+    storage_task = asyncio.create_task(get_storage().get(content_hash))
+    try:
+        att = await db.get_attestation(content_hash)
+        if not att:
+            raise HTTPException(404, "attestation not found")
+        if not att.get("stored"):
+            raise HTTPException(404, "content not stored for this attestation")
+    except BaseException:
+        # The fetch opens the content in a worker thread, which cancelling
+        # can't stop; let it finish and close whatever it opened
+        fetched = (await asyncio.gather(storage_task, return_exceptions=True))[0]
+        if isinstance(fetched, tuple):
+            await fetched[0].aclose()
+        raise
+
+    result = await storage_task
     if result is None:
         raise HTTPException(404, "content not found in storage")
 
-    data, content_type = result
-    return Response(content=data, media_type=content_type)
+    chunks, content_type, size = result
+    return StreamingResponse(chunks, media_type=content_type, headers={**cache_headers, "Content-Length": str(size)})
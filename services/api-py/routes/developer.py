@@ -1,24 +1,33 @@
 import asyncio
-import hashlib
+import functools
+import mimetypes
+import os
 import secrets
+import time
+from collections.abc import Awaitable
+from dataclasses import dataclass, field
 
-import httpx
 from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, UploadFile
 from pydantic import BaseModel
-from nacl.signing import VerifyKey
-from nacl.exceptions import BadSignatureError
-import base58
-
-from auth import require_api_key
-from config import Settings
-from similarity import compute_tlsh, compute_clip_embedding
-from routes.verify import run_verifier, validate_upload
-from routes.attest import _submit_attestation, MAX_FILE_SIZE
+import b58
+
+from auth import clear_api_key_cache, invalidate_api_key, optional_customer, require_api_key
+from config import Settings, get_settings
+from did import get_all_dids_for_org
+from mailer import code_email, send_email, verification_template
+from sigverify import verify_signature
+from similarity import ContentHasher, compute_clip_embedding, compute_hashes
+from routes.verify import read_upload, run_verifier, validate_upload
+from routes.auth_routes import _EMAIL_RE, _consume_email_code, _issue_email_code
+from routes.attest import fetch_url, fingerprint_content, submit_with_storage, wallet_signature_valid, MAX_FILE_SIZE
 from storage import get_storage
+from ttl_store import ExpiringStore
 import db
 
 router = APIRouter()
 
+_VERIFY_EMAIL = verification_template("Verify your email address.")
+
 
 # ── Register ──────────────────────────────────────────────────────
 
@@ -49,47 +58,41 @@ async def register(req: RegisterRequest):
         if not req.wallet_message.startswith("R3L-register:"):
             raise HTTPException(400, "wallet_message must start with 'R3L-register:'")
         try:
-            pk_bytes = base58.b58decode(req.wallet_pubkey)
-            sig_bytes = base58.b58decode(req.wallet_signature)
+            pk_bytes = b58.b58decode(req.wallet_pubkey)
+            sig_bytes = b58.b58decode(req.wallet_signature)
         except Exception:
             raise HTTPException(400, "invalid base58 encoding")
         if len(pk_bytes) != 32:
             raise HTTPException(400, "invalid wallet pubkey length")
-        try:
-            verify_key = VerifyKey(pk_bytes)
-            verify_key.verify(req.wallet_message.encode(), sig_bytes)
-        except BadSignatureError:
+        if not await verify_signature(pk_bytes, req.wallet_message.encode(), sig_bytes):
             raise HTTPException(400, "invalid wallet signature")
 
     # ── Email normalization ──
     email = req.email.strip().lower() if req.email else None
 
-    # ── Idempotency: check existing accounts ──
-    if has_wallet:
-        existing = await db.get_customer_by_wallet(req.wallet_pubkey)
-        if existing:
-            result = {"api_key": existing["api_key"], "name": existing["name"], "existing": True}
-            if existing.get("email"):
-                result["email"] = existing["email"]
-            if existing.get("wallet_pubkey"):
-                result["wallet_pubkey"] = existing["wallet_pubkey"]
-            return result
+    # ── Idempotency: check existing accounts (and the org, concurrently) ──
+    customer_lookup = db.find_customer(
+        wallet_pubkey=req.wallet_pubkey if has_wallet else None, email=email,
+    )
+    if has_org:
+        existing, org = await asyncio.gather(
+            customer_lookup, db.get_organization_by_domain(req.org_domain)
+        )
+    else:
+        existing, org = await customer_lookup, None
 
-    if email:
-        existing = await db.get_customer_by_email(email)
-        if existing:
-            result = {"api_key": existing["api_key"], "name": existing["name"], "existing": True}
-            if existing.get("email"):
-                result["email"] = existing["email"]
-            if existing.get("wallet_pubkey"):
-                result["wallet_pubkey"] = existing["wallet_pubkey"]
-            return result
+    if existing:
+        result = {"api_key": existing["api_key"], "name": existing["name"], "existing": True}
+        if existing.get("email"):
+            result["email"] = existing["email"]
+        if existing.get("wallet_pubkey"):
+            result["wallet_pubkey"] = existing["wallet_pubkey"]
+        return result
 
     # ── Org lookup ──
     org_id = None
     org_domain = None
     if has_org:
-        org = await db.get_organization_by_domain(req.org_domain)
         if not org:
             raise HTTPException(404, f"organization '{req.org_domain}' not found")
         if not org["verified"]:
@@ -107,19 +110,9 @@ async def register(req: RegisterRequest):
         email=email,
         wallet_pubkey=req.wallet_pubkey if has_wallet else None,
         auth_method="wallet" if has_wallet else ("email" if email else None),
+        org_id=org_id,
     )
 
-    # Link org if provided
-    if org_id:
-        from sqlalchemy import select, text as sql_text
-        async with db.get_session() as session:
-            from models import Customer
-            stmt = select(Customer).where(Customer.id == customer["id"])
-            row = (await session.execute(stmt)).scalar_one_or_none()
-            if row:
-                row.org_id = org_id
-                await session.commit()
-
     result = {
         "api_key": customer["api_key"],
         "name": customer["name"],
@@ -158,78 +151,39 @@ async def _process_verify_identity(req: VerifyIdentityRequest, caller: dict) ->
     # ── Email: send code or confirm ──
     if has_email:
         email = req.email.strip().lower()
-        if "@" not in email:
+        if not _EMAIL_RE.fullmatch(email):
             raise HTTPException(400, "invalid email")
-        domain = email.split("@", 1)[1]
-        if "." not in domain or len(domain) < 3:
-            raise HTTPException(400, "invalid email domain")
 
         if has_code:
-            from routes.auth_routes import _email_codes, EXPIRY, MAX_ATTEMPTS
-            from datetime import datetime
-
-            entry = _email_codes.get(email)
-            if not entry:
-                raise HTTPException(404, "no verification pending for this email")
-            if datetime.now() - entry.created_at > EXPIRY:
-                del _email_codes[email]
-                raise HTTPException(410, "code expired")
-            if entry.attempts >= MAX_ATTEMPTS:
-                del _email_codes[email]
-                raise HTTPException(429, "too many attempts")
-            if entry.code != req.code:
-                entry.attempts += 1
-                remaining = MAX_ATTEMPTS - entry.attempts
-                if remaining <= 0:
-                    del _email_codes[email]
-                    raise HTTPException(429, "too many attempts")
-                raise HTTPException(400, f"invalid code \u2014 {remaining} attempt{'s' if remaining != 1 else ''} remaining")
-
-            del _email_codes[email]
+            await _consume_email_code(email, req.code)
 
             existing = await db.get_customer_by_email(email)
             if existing:
                 if existing["id"] != caller["id"]:
                     await db.merge_customers(keep_id=caller["id"], remove_id=existing["id"])
+                    invalidate_api_key(existing["api_key"])
                     result["email"] = email
                     result["email_merged"] = True
                 else:
                     result["email"] = email
             else:
-                await db.link_email_to_customer(caller["id"], email)
+                try:
+                    await db.link_email_to_customer(caller["id"], email)
+                except db.EmailTaken:
+                    raise HTTPException(409, "email is linked to another account")
                 result["email"] = email
             result["email_status"] = "verified"
         else:
-            from routes.auth_routes import _email_codes, _clean_expired_emails, _generate_code, _send_email, EmailCode
-
-            _clean_expired_emails()
-            code = _generate_code()
-            _email_codes[email] = EmailCode(email=email, code=code)
+            code = await _issue_email_code(email)
 
-            settings = Settings()
+            settings = get_settings()
             result["email"] = email
             result["email_status"] = "pending"
 
             if settings.smtp_host:
-                from email.mime.text import MIMEText
-                html_body = f"""<!DOCTYPE html>
-<html><head><meta charset="utf-8"></head>
-<body style="font-family:system-ui,sans-serif;background:#0a0a0f;color:#e5e5e5;margin:0;padding:40px;">
-<div style="max-width:480px;margin:0 auto;background:#1a1a2e;border:1px solid #2d2d44;border-radius:12px;padding:40px;text-align:center;">
-<h1 style="color:#facc15;margin:0 0 8px;font-size:24px;">R3L Provenance</h1>
-<p style="color:#9ca3af;margin:0 0 24px;">Verify your email address.</p>
-<p style="color:#e5e5e5;margin:0 0 8px;">Your verification code:</p>
-<p style="font-size:36px;font-weight:700;color:#facc15;letter-spacing:8px;margin:0 0 24px;">{code}</p>
-<p style="color:#6b7280;font-size:12px;margin:0;">This code expires in 30 minutes.</p>
-</div>
-</body></html>"""
-                from_addr = settings.smtp_from or settings.smtp_user
-                msg = MIMEText(html_body, "html")
-                msg["Subject"] = "R3L \u2014 Your verification code"
-                msg["From"] = from_addr
-                msg["To"] = email
+                msg = code_email(settings, _VERIFY_EMAIL, code, "R3L \u2014 Your verification code", email)
                 try:
-                    await asyncio.to_thread(_send_email, settings, msg)
+                    await asyncio.to_thread(send_email, settings, msg)
                 except Exception as e:
                     raise HTTPException(500, f"failed to send email: {e}")
             else:
@@ -243,23 +197,21 @@ async def _process_verify_identity(req: VerifyIdentityRequest, caller: dict) ->
             raise HTTPException(400, "wallet_message must start with 'R3L-verify:'")
 
         try:
-            pk_bytes = base58.b58decode(req.wallet_pubkey)
-            sig_bytes = base58.b58decode(req.wallet_signature)
+            pk_bytes = b58.b58decode(req.wallet_pubkey)
+            sig_bytes = b58.b58decode(req.wallet_signature)
         except Exception:
             raise HTTPException(400, "invalid base58 encoding")
         if len(pk_bytes) != 32:
             raise HTTPException(400, "invalid wallet pubkey length")
 
-        try:
-            verify_key = VerifyKey(pk_bytes)
-            verify_key.verify(req.wallet_message.encode(), sig_bytes)
-        except BadSignatureError:
+        if not await verify_signature(pk_bytes, req.wallet_message.encode(), sig_bytes):
             raise HTTPException(400, "invalid wallet signature")
 
         existing = await db.get_customer_by_wallet(req.wallet_pubkey)
         if existing:
             if existing["id"] != caller["id"]:
                 await db.merge_customers(keep_id=caller["id"], remove_id=existing["id"])
+                invalidate_api_key(existing["api_key"])
                 result["wallet_merged"] = True
         else:
             await db.link_wallet_to_customer(caller["id"], req.wallet_pubkey)
@@ -283,29 +235,19 @@ async def _process_verify_identity(req: VerifyIdentityRequest, caller: dict) ->
 
         # Mark verified (email domain match is proof of org membership)
         if not org.get("verified"):
-            from sqlalchemy import select as sa_select
-            async with db.get_session() as session:
-                from models import Organization
-                row = (await session.execute(sa_select(Organization).where(Organization.id == org["id"]))).scalar_one()
-                row.verified = True
-                row.verification_method = "email"
-                row.admin_email = caller_email
-                await session.commit()
-                org = row.to_dict()
-
-        from sqlalchemy import select
-        async with db.get_session() as session:
-            from models import Customer
-            stmt = select(Customer).where(Customer.id == caller["id"])
-            row = (await session.execute(stmt)).scalar_one_or_none()
-            if not row:
-                raise HTTPException(404, "account not found")
-            row.org_id = org["id"]
-            await session.commit()
+            org = await db.update_organization(
+                org["id"], verified=True, verification_method="email", admin_email=caller_email,
+            )
+            # Org keys cache org_verified — drop them all
+            clear_api_key_cache()
+
+        if not await db.set_customer_org(caller["id"], org["id"]):
+            raise HTTPException(404, "account not found")
 
         result["org_domain"] = org["domain"]
         result["org_status"] = "verified"
 
+    invalidate_api_key(caller["api_key"])
     return result
 
 
@@ -326,72 +268,143 @@ async def verify_identity(req: VerifyIdentityRequest, caller: dict = Depends(req
 
 # ── Content verification + attestation ────────────────────────────
 
+# Recent attestations, so a resubmitted payload skips TLSH, CLIP, the verifier
+# and the Solana round-trips. Keyed by the upload's hash together with who
+# submitted it and with which wallet and options, so a hit only ever replays
+# the same submitter's own result. Never used for private items or callers in
+# privacy mode. Per process.
+ATTEST_MEMO_MAX = 4096
+
+
+@dataclass
+class AttestMemo:
+    result: dict
+    created_at: float = field(default_factory=time.monotonic)
+
+
+_attest_memo: ExpiringStore | None = None
+
+
+def _attest_memo_store(settings: Settings, caller: dict | None, is_private: bool) -> ExpiringStore | None:
+    """The memo, or None when dedup is disabled, the item is private or the caller is in privacy mode."""
+    global _attest_memo
+    if is_private or settings.attest_dedup_ttl <= 0 or (caller and caller.get("privacy_mode")):
+        return None
+    if _attest_memo is None:
+        _attest_memo = ExpiringStore(settings.attest_dedup_ttl, max_size=ATTEST_MEMO_MAX)
+    return _attest_memo
+
 
-async def _attest_file(file_bytes: bytes, filename: str, content_type: str | None,
+def _memo_key(content_hash_hex: str, caller: dict | None, should_store: bool,
+              wallet_pubkey: str | None = None, wallet_message: str | None = None,
+              wallet_signature: str | None = None) -> tuple:
+    return (content_hash_hex, caller["id"] if caller else None, should_store,
+            wallet_pubkey, wallet_message, wallet_signature)
+
+
+def _recall_attestation(memo: ExpiringStore | None, key: tuple) -> dict | None:
+    entry = memo.get(key) if memo is not None else None
+    if entry is None or time.monotonic() - entry.created_at > memo.ttl:
+        return None
+    return {**entry.result, "existing": True}
+
+
+def _remember_attestation(memo: ExpiringStore | None, key: tuple, result: dict):
+    if memo is not None:
+        memo.put(key, AttestMemo(result=result))
+
+
+# Read the system MIME tables at import, not on the first upload
+mimetypes.init()
+
+
+@functools.lru_cache(maxsize=256)
+def _content_type_for_ext(ext: str) -> str:
+    return mimetypes.types_map.get(ext, "application/octet-stream")
+
+
+def _upload_content_type(file: UploadFile) -> str:
+    """The declared content type, or one inferred from the filename extension.
+
+    curl sends application/octet-stream for unknown types.
+    """
+    ct = file.content_type
+    if ct and ct != "application/octet-stream":
+        return ct
+    return _content_type_for_ext(os.path.splitext(file.filename or "")[1].lower())
+
+
+async def _attest_file(file_bytes: bytes, digests: tuple[str, str | None],
+                       filename: str, content_type: str | None,
                        settings: Settings, caller: dict | None,
                        should_store: bool, is_private: bool,
                        wallet_pubkey: str | None, wallet_message: str | None,
-                       wallet_signature: str | None) -> dict:
+                       wallet_signature: str | None, wallet_verified: bool | None = None) -> dict:
+    """digests is (sha256_hex, tlsh) from the ContentHasher fed while the upload was read."""
     validate_upload(file_bytes, content_type)
-    file_tlsh = compute_tlsh(file_bytes)
-    file_clip = compute_clip_embedding(file_bytes, content_type)
-    verify_output = await run_verifier(file_bytes, filename, settings)
+    sha256_hex, file_tlsh = digests
+    memo = _attest_memo_store(settings, caller, is_private)
+    memo_key = _memo_key(sha256_hex, caller, should_store, wallet_pubkey, wallet_message, wallet_signature)
+    prior = _recall_attestation(memo, memo_key)
+    if prior is not None:
+        return prior
+    file_clip, verify_output = await asyncio.gather(
+        asyncio.to_thread(compute_clip_embedding, file_bytes, content_type),
+        run_verifier(file_bytes, filename, settings),
+    )
     content_hash_hex = verify_output.get("content_hash")
     if not content_hash_hex:
         raise HTTPException(500, "no content hash from verifier")
+    storage_save = None
     if should_store:
-        storage = get_storage()
-        await storage.save(content_hash_hex, file_bytes, content_type or "application/octet-stream")
-    result = await _submit_attestation(
+        storage_save = get_storage().save(content_hash_hex, file_bytes, content_type or "application/octet-stream")
+    result = await submit_with_storage(
+        storage_save,
         settings=settings, content_hash_hex=content_hash_hex,
         verify_output=verify_output, tlsh_hash=file_tlsh,
         clip_embedding=file_clip, content_type="file",
         mime_type=content_type, content_size=len(file_bytes),
-        stored=should_store, wallet_pubkey=wallet_pubkey,
+        wallet_pubkey=wallet_pubkey,
         wallet_message=wallet_message, wallet_signature=wallet_signature,
         privacy_mode=caller.get("privacy_mode", False) if caller else False,
         private_mode=is_private,
+        wallet_verified=wallet_verified,
     )
     result["type"] = "file"
+    _remember_attestation(memo, memo_key, result)
     return result
 
 
 async def _attest_url(url: str, settings: Settings, caller: dict | None,
                       should_store: bool, is_private: bool) -> dict:
     fetch_headers = {"User-Agent": "R3L-Attester/1.0"}
-    try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=30) as client:
-            resp = await client.get(url, headers=fetch_headers)
-            resp.raise_for_status()
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(502, f"URL returned {e.response.status_code}")
-    except Exception as e:
-        raise HTTPException(502, f"failed to fetch URL: {e}")
-
-    page_bytes = resp.content
-    if len(page_bytes) > MAX_FILE_SIZE:
-        raise HTTPException(413, "page too large")
-
-    ct = resp.headers.get("content-type", "text/html").split(";")[0].strip()
-    content_hash_hex = hashlib.sha256(page_bytes).hexdigest()
-    file_tlsh = compute_tlsh(page_bytes)
-    file_clip = compute_clip_embedding(page_bytes, ct)
-
+    page = await fetch_url(url, fetch_headers, keep_body=should_store)
+    content_hash_hex = page.content_hash
+    memo = _attest_memo_store(settings, caller, is_private)
+    memo_key = _memo_key(content_hash_hex, caller, should_store)
+    prior = _recall_attestation(memo, memo_key)
+    if prior is not None:
+        return prior
+    file_clip = None
+    if page.body is not None:
+        file_clip = await asyncio.to_thread(compute_clip_embedding, page.body, page.content_type)
+
+    storage_save = None
     if should_store:
-        storage = get_storage()
-        await storage.save(content_hash_hex, page_bytes, ct)
+        storage_save = get_storage().save(content_hash_hex, page.body, page.content_type)
 
     verify_output = {"content_hash": content_hash_hex, "has_c2pa": False}
-    result = await _submit_attestation(
+    result = await submit_with_storage(
+        storage_save,
         settings=settings, content_hash_hex=content_hash_hex,
-        verify_output=verify_output, tlsh_hash=file_tlsh,
+        verify_output=verify_output, tlsh_hash=page.tlsh_hash,
         clip_embedding=file_clip, content_type="url",
-        source_url=url, mime_type=ct, content_size=len(page_bytes),
-        stored=should_store,
+        source_url=url, mime_type=page.content_type, content_size=page.size,
         privacy_mode=caller.get("privacy_mode", False) if caller else False,
         private_mode=is_private,
     )
     result["type"] = "url"
+    _remember_attestation(memo, memo_key, result)
     return result
 
 
@@ -401,25 +414,34 @@ async def _attest_text(text: str, settings: Settings, caller: dict | None,
     if len(text_bytes) > MAX_FILE_SIZE:
         raise HTTPException(413, "text too large")
 
-    content_hash_hex = hashlib.sha256(text_bytes).hexdigest()
-    file_tlsh = compute_tlsh(text_bytes)
-    file_clip = compute_clip_embedding(text_bytes, "text/plain")
+    # With the memo on, the digests are needed up front; they are reused below
+    memo = _attest_memo_store(settings, caller, is_private)
+    digests = memo_key = None
+    if memo is not None:
+        digests = await asyncio.to_thread(compute_hashes, text_bytes)
+        memo_key = _memo_key(digests[0], caller, should_store)
+        prior = _recall_attestation(memo, memo_key)
+        if prior is not None:
+            return prior
 
+    content_hash_hex, file_tlsh, file_clip = await fingerprint_content(text_bytes, "text/plain", digests)
+
+    storage_save = None
     if should_store:
-        storage = get_storage()
-        await storage.save(content_hash_hex, text_bytes, "text/plain")
+        storage_save = get_storage().save(content_hash_hex, text_bytes, "text/plain")
 
     verify_output = {"content_hash": content_hash_hex, "has_c2pa": False}
-    result = await _submit_attestation(
+    result = await submit_with_storage(
+        storage_save,
         settings=settings, content_hash_hex=content_hash_hex,
         verify_output=verify_output, tlsh_hash=file_tlsh,
         clip_embedding=file_clip, content_type="text",
         mime_type="text/plain", content_size=len(text_bytes),
-        stored=should_store,
         privacy_mode=caller.get("privacy_mode", False) if caller else False,
         private_mode=is_private,
     )
     result["type"] = "text"
+    _remember_attestation(memo, memo_key, result)
     return result
 
 
@@ -435,6 +457,7 @@ async def attest_content(
     wallet_message: str | None = Form(None),
     wallet_signature: str | None = Form(None),
     x_api_key: str | None = Header(None),
+    settings: Settings = Depends(get_settings),
 ):
     """Verify and attest one content item. Provide exactly one of: file, url, or text.
 
@@ -450,18 +473,15 @@ async def attest_content(
     if types > 1:
         raise HTTPException(400, "only one content type per request — use /attest-content/batch for multiple")
 
-    settings = Settings()
-    caller = await db.get_customer_by_api_key(x_api_key) if x_api_key else None
+    caller = await optional_customer(x_api_key)
     should_store = store_content.lower() not in ("false", "0", "no")
     is_private = private_mode.lower() not in ("false", "0", "no")
 
     if has_file:
-        file_bytes = await file.read()
-        ct = file.content_type
-        if not ct or ct == "application/octet-stream":
-            import mimetypes
-            ct = mimetypes.guess_type(file.filename or "")[0] or "application/octet-stream"
-        return await _attest_file(file_bytes, file.filename or "upload", ct,
+        hasher = ContentHasher()
+        file_bytes = await read_upload(file, hasher)
+        ct = _upload_content_type(file)
+        return await _attest_file(file_bytes, hasher.digests(), file.filename or "upload", ct,
                                   settings, caller, should_store, is_private,
                                   wallet_pubkey, wallet_message, wallet_signature)
     elif has_url:
@@ -482,6 +502,7 @@ async def attest_content_batch(
     wallet_message: str | None = Form(None),
     wallet_signature: str | None = Form(None),
     x_api_key: str | None = Header(None),
+    settings: Settings = Depends(get_settings),
 ):
     """Verify and attest multiple content items in one call. Supports multiple files, plus optional url and text."""
     real_files = [f for f in file if f.filename]
@@ -491,41 +512,45 @@ async def attest_content_batch(
     if not real_files and not has_url and not has_text:
         raise HTTPException(400, "provide at least one of: files, url, or text")
 
-    settings = Settings()
-    caller = await db.get_customer_by_api_key(x_api_key) if x_api_key else None
+    caller = await optional_customer(x_api_key)
     should_store = store_content.lower() not in ("false", "0", "no")
     is_private = private_mode.lower() not in ("false", "0", "no")
 
-    results = []
-    for f in real_files:
-        try:
-            file_bytes = await f.read()
-            ct = f.content_type
-            # curl sends application/octet-stream for unknown types — infer from extension
-            if not ct or ct == "application/octet-stream":
-                import mimetypes
-                ct = mimetypes.guess_type(f.filename or "")[0] or "application/octet-stream"
-            results.append(await _attest_file(file_bytes, f.filename or "upload", ct,
-                                              settings, caller, should_store, is_private,
-                                              wallet_pubkey, wallet_message, wallet_signature))
-        except HTTPException as e:
-            results.append({"type": "file", "filename": f.filename, "error": e.detail, "status": e.status_code})
-        except Exception as e:
-            results.append({"type": "file", "filename": f.filename, "error": str(e), "status": 500})
+    # Every file shares one wallet signature — verify it once for the whole batch.
+    # Each file still runs its own message/length checks, then reuses this
+    # result instead of verifying again (a bad signature fails every file).
+    wallet_verified = None
+    if wallet_pubkey and wallet_message and wallet_signature:
+        wallet_verified = await wallet_signature_valid(wallet_pubkey, wallet_message, wallet_signature)
+
+    # Items run concurrently, at most batch_concurrency at a time. Each upload is
+    # read inside its own slot, so only that many files are buffered at once.
+    sem = asyncio.Semaphore(max(1, settings.batch_concurrency))
+
+    async def attest_upload(f: UploadFile) -> dict:
+        hasher = ContentHasher()
+        file_bytes = await read_upload(f, hasher)
+        ct = _upload_content_type(f)
+        return await _attest_file(file_bytes, hasher.digests(), f.filename or "upload", ct,
+                                  settings, caller, should_store, is_private,
+                                  wallet_pubkey, wallet_message, wallet_signature,
+                                  wallet_verified)
+
+    async def run(error_shape: dict, work: Awaitable[dict]) -> dict:
+        async with sem:
+            try:
+                return await work
+            except HTTPException as e:
+                return {**error_shape, "error": e.detail, "status": e.status_code}
+            except Exception as e:
+                return {**error_shape, "error": str(e), "status": 500}
+
+    jobs = [run({"type": "file", "filename": f.filename}, attest_upload(f)) for f in real_files]
     if has_url:
-        try:
-            results.append(await _attest_url(url, settings, caller, should_store, is_private))
-        except HTTPException as e:
-            results.append({"type": "url", "url": url, "error": e.detail, "status": e.status_code})
-        except Exception as e:
-            results.append({"type": "url", "url": url, "error": str(e), "status": 500})
+        jobs.append(run({"type": "url", "url": url}, _attest_url(url, settings, caller, should_store, is_private)))
     if has_text:
-        try:
-            results.append(await _attest_text(text, settings, caller, should_store, is_private))
-        except HTTPException as e:
-            results.append({"type": "text", "error": e.detail, "status": e.status_code})
-        except Exception as e:
-            results.append({"type": "text", "error": str(e), "status": 500})
+        jobs.append(run({"type": "text"}, _attest_text(text, settings, caller, should_store, is_private)))
+    results = await asyncio.gather(*jobs)
 
     return {"results": results}
 
@@ -538,7 +563,6 @@ async def get_me(caller: dict = Depends(require_api_key)):
     """Get account info. Alias for /api/auth/me."""
     if caller.get("type") == "org":
         org = await db.get_organization_by_id(caller["org_id"])
-        from did import get_all_dids_for_org
         dids = get_all_dids_for_org(org) if org else {}
         return {
             "type": "org",
@@ -1,11 +1,20 @@
-from fastapi import APIRouter, HTTPException
+import functools
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Response
 from urllib.parse import unquote
 
 from did import resolve_did
-from config import Settings
+from config import Settings, get_settings
 
 router = APIRouter()
 
+# resolve_did is a pure function of the DID string; error documents are cached
+# too, so repeated bad DIDs cost a dict lookup
+_resolve_did_cached = functools.lru_cache(maxsize=1024)(resolve_did)
+
+PLATFORM_DID_CACHE_CONTROL = "public, max-age=3600"
+
 
 @router.get("/did/{did:path}")
 async def resolve(did: str):
@@ -13,18 +22,31 @@ async def resolve(did: str):
     did = unquote(did)
     if not did.startswith("did:"):
         raise HTTPException(400, "invalid DID — must start with 'did:'")
-    doc = resolve_did(did)
+    doc = _resolve_did_cached(did)
     if "error" in doc:
         raise HTTPException(400, doc["error"])
     return doc
 
 
 @router.get("/.well-known/did.json")
-async def platform_did():
+async def platform_did(settings: Settings = Depends(get_settings)):
     """Serve the DID document for the R3L platform itself."""
-    settings = Settings()
+    return Response(
+        content=_platform_did_json(settings.public_url),
+        media_type="application/json",
+        headers={"Cache-Control": PLATFORM_DID_CACHE_CONTROL},
+    )
+
+
+@functools.lru_cache(maxsize=4)
+def _platform_did_json(public_url: str) -> bytes:
+    """The platform DID document, encoded once per public_url."""
+    return orjson.dumps(_platform_did_document(public_url))
+
+
+def _platform_did_document(public_url: str) -> dict:
     # Extract domain from public_url
-    domain = settings.public_url.replace("https://", "").replace("http://", "").split("/")[0]
+    domain = public_url.replace("https://", "").replace("http://", "").split("/")[0]
     return {
         "@context": ["https://www.w3.org/ns/did/v1"],
         "id": f"did:web:{domain}",
@@ -33,12 +55,12 @@ async def platform_did():
             {
                 "id": f"did:web:{domain}#attestation",
                 "type": "R3LAttestation",
-                "serviceEndpoint": settings.public_url + "/api",
+                "serviceEndpoint": public_url + "/api",
             },
             {
                 "id": f"did:web:{domain}#verify",
                 "type": "R3LVerification",
-                "serviceEndpoint": settings.public_url + "/api/verify",
+                "serviceEndpoint": public_url + "/api/verify",
             },
         ],
     }
@@ -3,23 +3,21 @@ import secrets
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from nacl.signing import VerifyKey
-from nacl.exceptions import BadSignatureError
-import base58
+import b58
 
 from auth import require_api_key
-from config import Settings
+from sigverify import verify_signature
+from config import Settings, get_settings
 from versioning import VERIFIER_VERSION, compute_trust_bundle_hash
 from solana_tx import (
-    ATTESTATION_SEED,
+    attestation_pda,
     build_and_send_tx,
     create_ed25519_instruction,
     encode_attestation_data,
-    find_pda,
+    fetch_latest_blockhash,
 )
 from solana_read import lookup_attestation
 import db
-from solders.pubkey import Pubkey
 
 router = APIRouter()
 
@@ -55,18 +53,15 @@ class RegisterRequest(BaseModel):
 async def register(req: RegisterRequest):
     # 1. Verify Ed25519 signature proves wallet ownership
     try:
-        pubkey_bytes = base58.b58decode(req.pubkey)
-        sig_bytes = base58.b58decode(req.signature)
+        pubkey_bytes = b58.b58decode(req.pubkey)
+        sig_bytes = b58.b58decode(req.signature)
     except Exception:
         raise HTTPException(400, "invalid base58 encoding")
 
     if len(pubkey_bytes) != 32:
         raise HTTPException(400, "invalid pubkey length")
 
-    try:
-        verify_key = VerifyKey(pubkey_bytes)
-        verify_key.verify(req.message.encode(), sig_bytes)
-    except BadSignatureError:
+    if not await verify_signature(pubkey_bytes, req.message.encode(), sig_bytes):
         raise HTTPException(400, "invalid signature")
 
     # 2. Check if wallet is already registered
@@ -81,9 +76,38 @@ async def register(req: RegisterRequest):
     return {"api_key": customer["api_key"], "pubkey": req.pubkey, "name": customer["name"]}
 
 
+async def _resolve_wallet(req: EdgeAttestRequest, customer: dict, settings: Settings) -> tuple:
+    """(wallet_bytes, wallet_pubkey, ed25519_ix) for the customer's wallet, if a signature was sent."""
+    customer_wallet = customer.get("wallet_pubkey")
+    if not (customer_wallet and req.wallet_signature):
+        return b"\x00" * 32, None, None
+
+    try:
+        pk_bytes = b58.b58decode(customer_wallet)
+        sig_bytes = b58.b58decode(req.wallet_signature)
+    except Exception:
+        raise HTTPException(400, "invalid base58 encoding in wallet_signature")
+
+    if len(sig_bytes) != 64:
+        raise HTTPException(400, "invalid wallet signature length")
+
+    # Verify signature off-chain first (fast-fail), unless the precompile
+    # instruction will verify it on-chain
+    wallet_message = f"R3L: attest {req.content_hash}"
+    if not (settings.skip_offchain_ed25519_verify and not customer.get("privacy_mode", False)):
+        if not await verify_signature(pk_bytes, wallet_message.encode(), sig_bytes):
+            raise HTTPException(400, "invalid wallet signature")
+
+    ed25519_ix = create_ed25519_instruction(pk_bytes, sig_bytes, wallet_message.encode())
+    return pk_bytes, customer_wallet, ed25519_ix
+
+
 @router.post("/attest")
-async def edge_attest(req: EdgeAttestRequest, customer: dict = Depends(require_api_key)):
-    settings = Settings()
+async def edge_attest(
+    req: EdgeAttestRequest,
+    customer: dict = Depends(require_api_key),
+    settings: Settings = Depends(get_settings),
+):
 
     # 1. Validate content hash
     try:
@@ -93,14 +117,19 @@ async def edge_attest(req: EdgeAttestRequest, customer: dict = Depends(require_a
     if len(content_hash_bytes) != 32:
         raise HTTPException(400, "content hash must be 32 bytes")
 
-    program_id = Pubkey.from_string(settings.program_id)
-
-    # 2. Idempotency — check if attestation already exists
-    existing = await asyncio.to_thread(
-        lookup_attestation, settings.solana_rpc_url, settings.program_id, req.content_hash
+    # 2. Idempotency — check if attestation already exists. The wallet check
+    # and the tx's blockhash fetch run alongside it; an existing attestation
+    # still wins over a wallet error, as if they had run in order.
+    existing, blockhash, wallet = await asyncio.gather(
+        lookup_attestation(settings.solana_rpc_url, settings.program_id, req.content_hash),
+        fetch_latest_blockhash(settings.solana_rpc_url),
+        _resolve_wallet(req, customer, settings),
+        return_exceptions=True,
     )
+    if isinstance(existing, BaseException):
+        raise existing
     if existing:
-        pda, _ = find_pda([ATTESTATION_SEED, content_hash_bytes], program_id)
+        pda = attestation_pda(settings.program_id, content_hash_bytes)
         return {
             "signature": None,
             "attestation_pda": str(pda),
@@ -109,28 +138,11 @@ async def edge_attest(req: EdgeAttestRequest, customer: dict = Depends(require_a
         }
 
     # 3. Resolve wallet from customer record (only if signature provided)
-    wallet_bytes = b"\x00" * 32
-    wallet_pubkey = None
-    ed25519_ix = None
-    customer_wallet = customer.get("wallet_pubkey")
-    if customer_wallet and req.wallet_signature:
-        try:
-            pk_bytes = base58.b58decode(customer_wallet)
-            sig_bytes = base58.b58decode(req.wallet_signature)
-        except Exception:
-            raise HTTPException(400, "invalid base58 encoding in wallet_signature")
-
-        # Verify signature off-chain first (fast-fail)
-        wallet_message = f"R3L: attest {req.content_hash}"
-        try:
-            verify_key = VerifyKey(pk_bytes)
-            verify_key.verify(wallet_message.encode(), sig_bytes)
-        except BadSignatureError:
-            raise HTTPException(400, "invalid wallet signature")
-
-        wallet_bytes = pk_bytes
-        wallet_pubkey = customer_wallet
-        ed25519_ix = create_ed25519_instruction(pk_bytes, sig_bytes, wallet_message.encode())
+    if isinstance(wallet, BaseException):
+        raise wallet
+    wallet_bytes, wallet_pubkey, ed25519_ix = wallet
+    if isinstance(blockhash, BaseException):
+        blockhash = None  # build_and_send_tx fetches its own
 
     # Privacy mode: keep identity in Postgres but zero it out for Solana
     if customer.get("privacy_mode", False):
@@ -141,7 +153,7 @@ async def edge_attest(req: EdgeAttestRequest, customer: dict = Depends(require_a
     trust_hash = compute_trust_bundle_hash(settings.trust_dir)
 
     # 5. Encode unified instruction (single tx)
-    pda, _ = find_pda([ATTESTATION_SEED, content_hash_bytes], program_id)
+    pda = attestation_pda(settings.program_id, content_hash_bytes)
 
     ix_data = encode_attestation_data(
         content_hash=content_hash_bytes,
@@ -160,8 +172,7 @@ async def edge_attest(req: EdgeAttestRequest, customer: dict = Depends(require_a
     )
 
     extra_ixs = [ed25519_ix] if ed25519_ix else None
-    sig, pda_str = await asyncio.to_thread(
-        build_and_send_tx,
+    sig, pda_str = await build_and_send_tx(
         settings.solana_rpc_url,
         settings.solana_keypair_path,
         settings.program_id,
@@ -169,6 +180,7 @@ async def edge_attest(req: EdgeAttestRequest, customer: dict = Depends(require_a
         pda,
         200_000,
         extra_ixs,
+        blockhash,
     )
 
     # 6. Single DB insert (include org info if caller is an org key)
@@ -1,57 +1,29 @@
 import asyncio
-import random
 import secrets
-import smtplib
-import string
-from dataclasses import dataclass, field
-from datetime import datetime, timedelta
-from email.mime.text import MIMEText
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
 import db
-from auth import require_api_key, require_org_admin
-from config import Settings
+from auth import clear_api_key_cache, require_api_key, require_org_admin
+from config import Settings, get_settings
+from mailer import code_email, send_email, verification_template
 from did import get_all_dids_for_org
+from routes.auth_routes import _consume_email_code, _issue_email_code
 
 router = APIRouter()
 
-EXPIRY = timedelta(minutes=30)
+ORG_CODE_SCOPE = "org"  # email_codes.scope for org domain/login codes
 
-
-# ── In-memory email code store ──────────────────────────────────────
-
-MAX_ATTEMPTS = 5
-
-
-@dataclass
-class EmailCode:
-    domain: str
-    email: str
-    code: str
-    attempts: int = 0
-    created_at: datetime = field(default_factory=datetime.now)
-
-
-_email_codes: dict[str, EmailCode] = {}  # keyed by email
-
-
-def _clean_expired():
-    now = datetime.now()
-    expired = [k for k, v in _email_codes.items() if now - v.created_at > EXPIRY]
-    for k in expired:
-        del _email_codes[k]
+_DOMAIN_EMAIL = verification_template("Verify your organization domain.")
+_RESEND_EMAIL = verification_template("Verify your organization domain.", "Your new verification code:")
+_LOGIN_EMAIL = verification_template("Log in to your organization.")
 
 
 def _generate_api_key() -> str:
     return "r3l_" + secrets.token_hex(24)
 
 
-def _generate_code() -> str:
-    return "".join(random.choices(string.digits, k=6))
-
-
 # ── Request models ──────────────────────────────────────────────────
 
 class RegisterRequest(BaseModel):
@@ -100,7 +72,7 @@ BLOCKED_DOMAINS: set[str] = set()
 # ── POST /api/org/register ──────────────────────────────────────────
 
 @router.post("/register")
-async def register(req: RegisterRequest):
+async def register(req: RegisterRequest, settings: Settings = Depends(get_settings)):
     domain = req.domain.lower().strip()
     if not domain or "." not in domain:
         raise HTTPException(400, "invalid domain")
@@ -119,15 +91,8 @@ async def register(req: RegisterRequest):
         if email_domain != domain:
             raise HTTPException(400, f"email must be @{domain}")
 
-        code = _generate_code()
-        _clean_expired()
-        _email_codes[req.admin_email.lower()] = EmailCode(
-            domain=domain,
-            email=req.admin_email.lower(),
-            code=code,
-        )
+        code = await _issue_email_code(req.admin_email.lower(), ORG_CODE_SCOPE, domain)
 
-        settings = Settings()
         resp = {
             "status": "pending",
             "method": "email",
@@ -137,25 +102,10 @@ async def register(req: RegisterRequest):
         }
 
         if settings.smtp_host:
-            html_body = f"""<!DOCTYPE html>
-<html><head><meta charset="utf-8"></head>
-<body style="font-family:system-ui,sans-serif;background:#0a0a0f;color:#e5e5e5;margin:0;padding:40px;">
-<div style="max-width:480px;margin:0 auto;background:#1a1a2e;border:1px solid #2d2d44;border-radius:12px;padding:40px;text-align:center;">
-<h1 style="color:#facc15;margin:0 0 8px;font-size:24px;">R3L Provenance</h1>
-<p style="color:#9ca3af;margin:0 0 24px;">Log in to your organization.</p>
-<p style="color:#e5e5e5;margin:0 0 8px;">Your verification code:</p>
-<p style="font-size:36px;font-weight:700;color:#facc15;letter-spacing:8px;margin:0 0 24px;">{code}</p>
-<p style="color:#6b7280;font-size:12px;margin:0;">This code expires in 30 minutes.</p>
-</div>
-</body></html>"""
-            from_addr = settings.smtp_from or settings.smtp_user
-            msg = MIMEText(html_body, "html")
-            msg["Subject"] = "R3L \u2014 Organization login code"
-            msg["From"] = from_addr
-            msg["To"] = req.admin_email
+            msg = code_email(settings, _LOGIN_EMAIL, code, "R3L \u2014 Organization login code", req.admin_email)
 
             try:
-                await asyncio.to_thread(_send_email, settings, msg)
+                await asyncio.to_thread(send_email, settings, msg)
             except Exception as e:
                 raise HTTPException(500, f"failed to send email: {e}")
         else:
@@ -178,19 +128,12 @@ async def register(req: RegisterRequest):
             )
         # For existing orgs, update dns_token in-place
         if existing:
-            async with db.get_session() as session:
-                from sqlalchemy import select
-                from models import Organization
-                stmt = select(Organization).where(Organization.domain == domain)
-                row = (await session.execute(stmt)).scalar_one_or_none()
-                if row:
-                    row.dns_token = dns_token
-                    row.verification_method = "dns"
-                    if req.admin_email:
-                        row.admin_email = req.admin_email
-                    if req.name:
-                        row.name = req.name
-                    await session.commit()
+            values = {"dns_token": dns_token, "verification_method": "dns"}
+            if req.admin_email:
+                values["admin_email"] = req.admin_email
+            if req.name:
+                values["name"] = req.name
+            await db.update_organization(existing["id"], **values)
 
         return {
             "status": "pending",
@@ -216,15 +159,8 @@ async def register(req: RegisterRequest):
                 admin_email=req.admin_email,
             )
 
-        code = _generate_code()
-        _clean_expired()
-        _email_codes[req.admin_email.lower()] = EmailCode(
-            domain=domain,
-            email=req.admin_email.lower(),
-            code=code,
-        )
+        code = await _issue_email_code(req.admin_email.lower(), ORG_CODE_SCOPE, domain)
 
-        settings = Settings()
         resp = {
             "status": "pending",
             "method": "email",
@@ -233,25 +169,10 @@ async def register(req: RegisterRequest):
         }
 
         if settings.smtp_host:
-            html_body = f"""<!DOCTYPE html>
-<html><head><meta charset="utf-8"></head>
-<body style="font-family:system-ui,sans-serif;background:#0a0a0f;color:#e5e5e5;margin:0;padding:40px;">
-<div style="max-width:480px;margin:0 auto;background:#1a1a2e;border:1px solid #2d2d44;border-radius:12px;padding:40px;text-align:center;">
-<h1 style="color:#facc15;margin:0 0 8px;font-size:24px;">R3L Provenance</h1>
-<p style="color:#9ca3af;margin:0 0 24px;">Verify your organization domain.</p>
-<p style="color:#e5e5e5;margin:0 0 8px;">Your verification code:</p>
-<p style="font-size:36px;font-weight:700;color:#facc15;letter-spacing:8px;margin:0 0 24px;">{code}</p>
-<p style="color:#6b7280;font-size:12px;margin:0;">This code expires in 30 minutes.</p>
-</div>
-</body></html>"""
-            from_addr = settings.smtp_from or settings.smtp_user
-            msg = MIMEText(html_body, "html")
-            msg["Subject"] = "R3L — Organization verification code"
-            msg["From"] = from_addr
-            msg["To"] = req.admin_email
+            msg = code_email(settings, _DOMAIN_EMAIL, code, "R3L — Organization verification code", req.admin_email)
 
             try:
-                await asyncio.to_thread(_send_email, settings, msg)
+                await asyncio.to_thread(send_email, settings, msg)
             except Exception as e:
                 raise HTTPException(500, f"failed to send email: {e}")
         else:
@@ -264,12 +185,6 @@ async def register(req: RegisterRequest):
         raise HTTPException(400, "method must be 'dns' or 'email'")
 
 
-def _send_email(settings: Settings, msg: MIMEText):
-    with smtplib.SMTP_SSL(settings.smtp_host, 465) as server:
-        server.login(settings.smtp_user, settings.smtp_pass)
-        server.send_message(msg)
-
-
 # ── POST /api/org/verify/dns ────────────────────────────────────────
 
 @router.post("/verify/dns")
@@ -324,32 +239,8 @@ async def verify_dns(req: VerifyDnsRequest):
 @router.post("/verify/email")
 async def verify_email(req: VerifyEmailRequest):
     email = req.email.lower().strip()
-    entry = _email_codes.get(email)
-
-    if not entry:
-        raise HTTPException(404, "no verification pending for this email")
-
-    if datetime.now() - entry.created_at > EXPIRY:
-        del _email_codes[email]
-        raise HTTPException(410, "verification code expired — request a new code")
-
-    if entry.attempts >= MAX_ATTEMPTS:
-        del _email_codes[email]
-        raise HTTPException(429, "too many attempts — request a new code")
-
-    if entry.code != req.code:
-        entry.attempts += 1
-        remaining = MAX_ATTEMPTS - entry.attempts
-        if remaining <= 0:
-            del _email_codes[email]
-            raise HTTPException(429, "too many attempts — request a new code")
-        raise HTTPException(
-            400,
-            f"invalid code — {remaining} attempt{'s' if remaining != 1 else ''} remaining",
-        )
-
-    domain = entry.domain
-    del _email_codes[email]
+    entry = await _consume_email_code(email, req.code, ORG_CODE_SCOPE)
+    domain = entry["domain"]
 
     verified_org = await db.verify_organization(domain)
     if not verified_org:
@@ -379,7 +270,7 @@ class ResendRequest(BaseModel):
 
 
 @router.post("/resend")
-async def resend_code(req: ResendRequest):
+async def resend_code(req: ResendRequest, settings: Settings = Depends(get_settings)):
     """Resend a verification code. Generates a fresh code and resets attempts."""
     domain = req.domain.lower().strip()
     email = req.admin_email.lower().strip()
@@ -394,33 +285,15 @@ async def resend_code(req: ResendRequest):
     if org["verified"]:
         raise HTTPException(409, "already verified")
 
-    code = _generate_code()
-    _clean_expired()
-    _email_codes[email] = EmailCode(domain=domain, email=email, code=code)
+    code = await _issue_email_code(email, ORG_CODE_SCOPE, domain)
 
-    settings = Settings()
     resp = {"status": "pending", "method": "email", "domain": domain, "email": req.admin_email}
 
     if settings.smtp_host:
-        html_body = f"""<!DOCTYPE html>
-<html><head><meta charset="utf-8"></head>
-<body style="font-family:system-ui,sans-serif;background:#0a0a0f;color:#e5e5e5;margin:0;padding:40px;">
-<div style="max-width:480px;margin:0 auto;background:#1a1a2e;border:1px solid #2d2d44;border-radius:12px;padding:40px;text-align:center;">
-<h1 style="color:#facc15;margin:0 0 8px;font-size:24px;">R3L Provenance</h1>
-<p style="color:#9ca3af;margin:0 0 24px;">Verify your organization domain.</p>
-<p style="color:#e5e5e5;margin:0 0 8px;">Your new verification code:</p>
-<p style="font-size:36px;font-weight:700;color:#facc15;letter-spacing:8px;margin:0 0 24px;">{code}</p>
-<p style="color:#6b7280;font-size:12px;margin:0;">This code expires in 30 minutes.</p>
-</div>
-</body></html>"""
-        from_addr = settings.smtp_from or settings.smtp_user
-        msg = MIMEText(html_body, "html")
-        msg["Subject"] = "R3L — New verification code"
-        msg["From"] = from_addr
-        msg["To"] = req.admin_email
+        msg = code_email(settings, _RESEND_EMAIL, code, "R3L — New verification code", req.admin_email)
 
         try:
-            await asyncio.to_thread(_send_email, settings, msg)
+            await asyncio.to_thread(send_email, settings, msg)
         except Exception as e:
             raise HTTPException(500, f"failed to send email: {e}")
     else:
@@ -472,6 +345,7 @@ async def revoke_key(key_id: int, admin: dict = Depends(require_org_admin)):
     ok = await db.revoke_org_api_key(key_id, org["id"])
     if not ok:
         raise HTTPException(404, "key not found or already revoked")
+    clear_api_key_cache()
     return {"status": "revoked"}
 
 
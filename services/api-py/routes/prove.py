@@ -1,37 +1,34 @@
 import asyncio
 import json
 import os
+import shutil
 import tempfile
 
-from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 
-from config import Settings
-from routes.verify import run_verifier
+from config import Settings, get_settings
+from routes.verify import UPLOAD_CHUNK_SIZE, run_verifier_on_file
 
 router = APIRouter()
 
 
 @router.post("/prove")
-async def prove(file: UploadFile = File(...)):
-    settings = Settings()
-    file_bytes = await file.read()
+async def prove(file: UploadFile = File(...), settings: Settings = Depends(get_settings)):
     filename = file.filename or "upload"
-
-    # 1. Verify
-    verify_output = await run_verifier(file_bytes, filename, settings)
-
-    # 2. Write file to temp (for prover)
     ext = os.path.splitext(filename)[1] if filename else ""
     media_tmp = tempfile.NamedTemporaryFile(suffix=ext, delete=False)
-    media_tmp.write(file_bytes)
-    media_tmp.close()
-
-    # 3. Create sidecar temp file
     sidecar_tmp = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
     sidecar_tmp.close()
 
     try:
-        # 4. Run prover binary
+        # 1. Copy the upload to temp in chunks; the verifier and prover both read it
+        with media_tmp:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, media_tmp, UPLOAD_CHUNK_SIZE)
+
+        # 2. Verify
+        verify_output = await run_verifier_on_file(media_tmp.name, filename, settings)
+
+        # 3. Run prover binary
         prover_bin = os.path.join(settings.prover_dir, "target/release/prove")
         args = [
             prover_bin,
@@ -57,7 +54,7 @@ async def prove(file: UploadFile = File(...)):
                 f"prover failed:\n--- stdout ---\n{stdout.decode()}\n--- stderr ---\n{stderr.decode()}",
             )
 
-        # 5. Read sidecar JSON
+        # 4. Read sidecar JSON
         with open(sidecar_tmp.name) as f:
             sidecar = json.load(f)
 
@@ -1,12 +1,11 @@
-import asyncio
 from enum import Enum
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
-from config import Settings
+from config import Settings, get_settings
 import db
-from solana_read import lookup_attestation
+from solana_read import lookup_attestation, lookup_attestations
 
 router = APIRouter()
 
@@ -92,7 +91,7 @@ def _format_response(att: dict) -> dict:
 
 
 @router.get("/v1/query/{content_hash}")
-async def query(content_hash: str):
+async def query(content_hash: str, settings: Settings = Depends(get_settings)):
     """
     Structured trust verdict for a content hash.
     Designed for external consumers, AI agents, and integrations.
@@ -103,10 +102,7 @@ async def query(content_hash: str):
         return _format_response(row)
 
     # On-chain fallback
-    settings = Settings()
-    att = await asyncio.to_thread(
-        lookup_attestation, settings.solana_rpc_url, settings.program_id, content_hash
-    )
+    att = await lookup_attestation(settings.solana_rpc_url, settings.program_id, content_hash)
     if att is None:
         raise HTTPException(404, detail={
             "version": "1.0",
@@ -118,7 +114,7 @@ async def query(content_hash: str):
 
 
 @router.post("/v1/query/batch")
-async def query_batch(hashes: list[str]):
+async def query_batch(hashes: list[str], settings: Settings = Depends(get_settings)):
     """
     Batch query for multiple content hashes. Returns a list of verdicts.
     Max 50 hashes per request.
@@ -126,17 +122,15 @@ async def query_batch(hashes: list[str]):
     if len(hashes) > 50:
         raise HTTPException(400, "max 50 hashes per batch request")
 
-    settings = Settings()
+    # One DB query for all hashes, then one getMultipleAccounts for the misses
+    found = await db.get_attestations(hashes)
+    misses = [h for h in hashes if h not in found]
+    if misses:
+        found.update(await lookup_attestations(settings.solana_rpc_url, settings.program_id, misses))
+
     results = []
     for h in hashes:
-        row = await db.get_attestation(h)
-        if row:
-            results.append(_format_response(row))
-            continue
-
-        att = await asyncio.to_thread(
-            lookup_attestation, settings.solana_rpc_url, settings.program_id, h
-        )
+        att = found.get(h)
         if att:
             results.append(_format_response(att))
         else:
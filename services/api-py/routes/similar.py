@@ -1,14 +1,16 @@
-import hashlib
+import asyncio
 
-from fastapi import APIRouter, File, HTTPException, UploadFile
+import numpy as np
+from fastapi import APIRouter, File, HTTPException, Request, UploadFile
 
-from routes.verify import validate_upload
-from similarity import compute_tlsh, compute_clip_embedding, tlsh_distance
+from routes.verify import read_upload, validate_upload
+from similarity import ContentHasher, compute_clip_embedding, tlsh_distance
 import db
 
 router = APIRouter()
 
 MAX_RESULTS = 20
+TLSH_CANDIDATES = 5 * MAX_RESULTS  # SQL prefilter is approximate — re-score a wider set
 
 
 def _classify_match(
@@ -39,6 +41,17 @@ def _build_match(row: dict, tlsh_dist: int | None, clip_sim: float | None) -> di
     }
 
 
+def _clip_available(request: Request) -> bool:
+    """True once CLIP is loaded, False if its load failed (TLSH only); 503 while loading."""
+    state = request.app.state
+    ready = getattr(state, "similarity_ready", None)
+    if ready is not None and ready.is_set():
+        return True
+    if getattr(state, "similarity_failed", False):
+        return False
+    raise HTTPException(503, "similarity model loading")
+
+
 def _sort_matches(matches: list[dict]) -> list[dict]:
     """Sort: exact first, then near_duplicate, visual_match, unrelated.
     Within each group, sort by best similarity (highest clip, lowest tlsh)."""
@@ -52,21 +65,28 @@ def _sort_matches(matches: list[dict]) -> list[dict]:
 
 
 @router.post("")
-async def search_similar_by_file(file: UploadFile = File(...)):
+async def search_similar_by_file(request: Request, file: UploadFile = File(...)):
     """Upload a file and find similar attested content."""
-    file_bytes = await file.read()
+    use_clip = _clip_available(request)
+    # SHA-256 + TLSH are computed as the upload is read
+    hasher = ContentHasher()
+    file_bytes = await read_upload(file, hasher)
     validate_upload(file_bytes, file.content_type)
+    content_hash, query_tlsh = hasher.digests()
 
-    # Compute hashes
-    content_hash = hashlib.sha256(file_bytes).hexdigest()
-    query_tlsh = compute_tlsh(file_bytes)
-    query_clip = compute_clip_embedding(file_bytes, file.content_type)
+    # CLIP runs in a worker thread while the exact-match lookup is in flight
+    if use_clip:
+        exact, query_clip = await asyncio.gather(
+            db.get_attestation(content_hash),
+            asyncio.to_thread(compute_clip_embedding, file_bytes, file.content_type),
+        )
+    else:
+        exact, query_clip = await db.get_attestation(content_hash), None
 
     matches = []
     seen_hashes = set()
 
     # 1. Exact match
-    exact = await db.get_attestation(content_hash)
     if exact:
         matches.append({
             "content_hash": exact["content_hash"],
@@ -81,18 +101,17 @@ async def search_similar_by_file(file: UploadFile = File(...)):
         })
         seen_hashes.add(content_hash)
 
-    # 2. TLSH scan — compare against all attestations with TLSH hashes (no distance cutoff)
+    # 2. TLSH candidates ranked in SQL, re-scored exactly here
     if query_tlsh:
-        tlsh_rows = await db.get_all_with_tlsh()
+        tlsh_rows = await db.get_similar_tlsh(query_tlsh, limit=TLSH_CANDIDATES)
         for row in tlsh_rows:
             if row["content_hash"] in seen_hashes:
                 continue
             dist = tlsh_distance(query_tlsh, row["tlsh_hash"])
             clip_sim = None
-            if query_clip and row.get("clip_embedding"):
-                a, b = query_clip, list(row["clip_embedding"])
-                dot = sum(x * y for x, y in zip(a, b))
-                clip_sim = dot  # both are L2-normalized, so dot = cosine
+            if query_clip and row.get("clip_embedding") is not None:
+                # both are L2-normalized, so dot = cosine
+                clip_sim = float(np.dot(query_clip, row["clip_embedding"]))
             seen_hashes.add(row["content_hash"])
             matches.append(_build_match(row, dist, clip_sim))
 
@@ -115,30 +134,28 @@ async def search_similar_by_file(file: UploadFile = File(...)):
 @router.get("/{content_hash}")
 async def search_similar_by_hash(content_hash: str):
     """Find content similar to an existing attestation."""
-    existing = await db.get_attestation(content_hash)
+    existing = await db.get_attestation(content_hash, include_embedding=True)
     if not existing:
         raise HTTPException(404, "attestation not found")
 
     query_tlsh = existing.get("tlsh_hash")
     query_clip = existing.get("clip_embedding")
     if query_clip is not None:
-        query_clip = list(query_clip)
+        query_clip = query_clip.tolist()
 
     matches = []
     seen_hashes = {content_hash}
 
-    # 1. TLSH scan (no distance cutoff)
+    # 1. TLSH candidates ranked in SQL, re-scored exactly here
     if query_tlsh:
-        tlsh_rows = await db.get_all_with_tlsh()
+        tlsh_rows = await db.get_similar_tlsh(query_tlsh, limit=TLSH_CANDIDATES)
         for row in tlsh_rows:
             if row["content_hash"] in seen_hashes:
                 continue
             dist = tlsh_distance(query_tlsh, row["tlsh_hash"])
             clip_sim = None
-            if query_clip and row.get("clip_embedding"):
-                a, b = query_clip, list(row["clip_embedding"])
-                dot = sum(x * y for x, y in zip(a, b))
-                clip_sim = dot
+            if query_clip and row.get("clip_embedding") is not None:
+                clip_sim = float(np.dot(query_clip, row["clip_embedding"]))
             seen_hashes.add(row["content_hash"])
             matches.append(_build_match(row, dist, clip_sim))
 
@@ -1,16 +1,12 @@
-import asyncio
-
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
-from config import Settings
+from config import Settings, get_settings
 from solana_tx import (
-    ATTESTATION_SEED,
+    attestation_pda,
     build_and_send_tx,
     encode_proof_data,
-    find_pda,
 )
-from solders.pubkey import Pubkey
 
 router = APIRouter()
 
@@ -22,8 +18,7 @@ class SubmitRequest(BaseModel):
 
 
 @router.post("/submit")
-async def submit(req: SubmitRequest):
-    settings = Settings()
+async def submit(req: SubmitRequest, settings: Settings = Depends(get_settings)):
 
     content_hash_bytes = bytes.fromhex(req.content_hash)
     if len(content_hash_bytes) != 32:
@@ -32,13 +27,11 @@ async def submit(req: SubmitRequest):
     proof_bytes = bytes.fromhex(req.proof)
     public_inputs_bytes = bytes.fromhex(req.public_inputs)
 
-    program_id = Pubkey.from_string(settings.program_id)
-    pda, _ = find_pda([ATTESTATION_SEED, content_hash_bytes], program_id)
+    pda = attestation_pda(settings.program_id, content_hash_bytes)
 
     ix_data = encode_proof_data(proof_bytes, public_inputs_bytes, content_hash_bytes)
 
-    sig, pda_str = await asyncio.to_thread(
-        build_and_send_tx,
+    sig, pda_str = await build_and_send_tx(
         settings.solana_rpc_url,
         settings.solana_keypair_path,
         settings.program_id,
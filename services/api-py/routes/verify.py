@@ -4,15 +4,17 @@ import json
 import os
 import tempfile
 
-from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 
-from config import Settings
+from config import Settings, get_settings
+from similarity import ContentHasher
 
 router = APIRouter()
 
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
 ALLOWED_MIME_PREFIXES = ("image/", "video/", "audio/", "application/pdf", "text/")
 VERIFIER_TIMEOUT = 60  # seconds
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
 
 
 def validate_upload(file_bytes: bytes, content_type: str | None = None):
@@ -24,61 +26,93 @@ def validate_upload(file_bytes: bytes, content_type: str | None = None):
             raise HTTPException(415, f"unsupported media type: {ct}")
 
 
+async def read_upload(upload: UploadFile, hasher: ContentHasher | None = None) -> bytes:
+    """Read an upload in chunks, rejecting it with 413 as soon as it passes MAX_FILE_SIZE.
+
+    When a hasher is given, each chunk is fed to it (in a worker thread) as it
+    arrives, so the digests are ready without a second pass over the bytes.
+    """
+    if upload.size is not None and upload.size > MAX_FILE_SIZE:
+        raise HTTPException(413, f"file too large: {upload.size} bytes (max {MAX_FILE_SIZE})")
+
+    chunks = []
+    total = 0
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        total += len(chunk)
+        if total > MAX_FILE_SIZE:
+            raise HTTPException(413, f"file too large: over {MAX_FILE_SIZE} bytes")
+        if hasher is not None:
+            await asyncio.to_thread(hasher.update, chunk)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
 async def run_verifier(file_bytes: bytes, filename: str, settings: Settings) -> dict:
     ext = os.path.splitext(filename)[1] if filename else ""
     tmp = tempfile.NamedTemporaryFile(suffix=ext, delete=False)
     try:
-        tmp.write(file_bytes)
+        await asyncio.to_thread(tmp.write, file_bytes)
         tmp.close()
-
-        proc = await asyncio.create_subprocess_exec(
-            settings.verifier_bin, tmp.name,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            env={**os.environ, "TRUST_DIR": settings.trust_dir},
-        )
-        try:
-            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=VERIFIER_TIMEOUT)
-        except asyncio.TimeoutError:
-            proc.kill()
-            raise HTTPException(504, "verifier timed out")
-
-        if proc.returncode != 0:
-            # Verifier can't handle this file type (e.g. PDF without C2PA support).
-            # Return an unsigned result with the content hash computed in Python.
-            content_hash = hashlib.sha256(file_bytes).hexdigest()
-            return {
-                "path": filename,
-                "content_hash": content_hash,
-                "has_c2pa": False,
-                "trust_list_match": None,
-                "validation_state": None,
-                "validation_error_count": None,
-                "validation_codes": None,
-                "title": None,
-                "format": None,
-                "digital_source_type": None,
-                "claim_generator": None,
-                "software_agent": None,
-                "issuer": None,
-                "common_name": None,
-                "signing_time": None,
-                "sig_algorithm": None,
-                "actions": None,
-                "ingredients": None,
-                "manifest_store": None,
-                "error": None,
-            }
-
-        return json.loads(stdout.decode())
+        return await run_verifier_on_file(tmp.name, filename, settings)
     finally:
         os.unlink(tmp.name)
 
 
+async def run_verifier_on_file(path: str, filename: str, settings: Settings) -> dict:
+    """run_verifier for content that is already on disk at path."""
+    proc = await asyncio.create_subprocess_exec(
+        settings.verifier_bin, path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env={**os.environ, "TRUST_DIR": settings.trust_dir},
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=VERIFIER_TIMEOUT)
+    except asyncio.TimeoutError:
+        proc.kill()
+        raise HTTPException(504, "verifier timed out")
+
+    if proc.returncode != 0:
+        # Verifier can't handle this file type (e.g. PDF without C2PA support).
+        # Return an unsigned result with the content hash computed in Python.
+        content_hash = await asyncio.to_thread(_sha256_file, path)
+        return {
+            "path": filename,
+            "content_hash": content_hash,
+            "has_c2pa": False,
+            "trust_list_match": None,
+            "validation_state": None,
+            "validation_error_count": None,
+            "validation_codes": None,
+            "title": None,
+            "format": None,
+            "digital_source_type": None,
+            "claim_generator": None,
+            "software_agent": None,
+            "issuer": None,
+            "common_name": None,
+            "signing_time": None,
+            "sig_algorithm": None,
+            "actions": None,
+            "ingredients": None,
+            "manifest_store": None,
+            "error": None,
+        }
+
+    return json.loads(stdout.decode())
+
+
+def _sha256_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
 @router.post("/verify")
-async def verify(file: UploadFile = File(...)):
-    settings = Settings()
-    file_bytes = await file.read()
+async def verify(file: UploadFile = File(...), settings: Settings = Depends(get_settings)):
+    file_bytes = await read_upload(file)
     validate_upload(file_bytes, file.content_type)
     result = await run_verifier(file_bytes, file.filename or "upload", settings)
     return result
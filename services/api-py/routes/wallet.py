@@ -1,17 +1,15 @@
-import asyncio
-
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from nacl.signing import VerifyKey
-from nacl.exceptions import BadSignatureError
-import base58
+import b58
 
-from config import Settings
+from sigverify import verify_signature
+from config import Settings, get_settings
 from solana_tx import (
     WALLET_SEED,
     build_and_send_tx,
     encode_wallet_data,
     find_pda,
+    program_pubkey,
 )
 import db
 from solders.pubkey import Pubkey
@@ -27,8 +25,7 @@ class WalletAttestRequest(BaseModel):
 
 
 @router.post("/attest")
-async def attest_wallet(req: WalletAttestRequest):
-    settings = Settings()
+async def attest_wallet(req: WalletAttestRequest, settings: Settings = Depends(get_settings)):
 
     # 1. Validate content hash
     try:
@@ -44,30 +41,26 @@ async def attest_wallet(req: WalletAttestRequest):
 
     # 3. Verify Ed25519 signature
     try:
-        pubkey_bytes = base58.b58decode(req.pubkey)
-        sig_bytes = base58.b58decode(req.signature)
+        pubkey_bytes = b58.b58decode(req.pubkey)
+        sig_bytes = b58.b58decode(req.signature)
     except Exception:
         raise HTTPException(400, "invalid base58 encoding")
 
     if len(pubkey_bytes) != 32:
         raise HTTPException(400, "invalid pubkey length")
 
-    try:
-        verify_key = VerifyKey(pubkey_bytes)
-        verify_key.verify(req.message.encode(), sig_bytes)
-    except BadSignatureError:
+    if not await verify_signature(pubkey_bytes, req.message.encode(), sig_bytes):
         raise HTTPException(400, "invalid signature")
 
     # 4. Derive PDA
     wallet_pubkey = Pubkey.from_string(req.pubkey)
-    program_id = Pubkey.from_string(settings.program_id)
+    program_id = program_pubkey(settings.program_id)
     pda, _ = find_pda([WALLET_SEED, content_hash_bytes, bytes(wallet_pubkey)], program_id)
 
     # 5. Encode + send Solana tx
     ix_data = encode_wallet_data(content_hash_bytes, wallet_pubkey)
 
-    sig, pda_str = await asyncio.to_thread(
-        build_and_send_tx,
+    sig, pda_str = await build_and_send_tx(
         settings.solana_rpc_url,
         settings.solana_keypair_path,
         settings.program_id,
@@ -0,0 +1,60 @@
+"""Ed25519 verification for wallet-signed messages.
+
+VerifyKey objects are cached per public key: wallets sign repeatedly, and
+building the key (point decompression) is most of the cost of a verify.
+
+verify_signature() checks each signature in a worker thread (libsodium
+releases the GIL), so verification never blocks the event loop and
+concurrent checks can use separate cores. Successful verifications are
+remembered for VERIFIED_TTL seconds, so a retried request with the same
+signature skips the curve math entirely.
+"""
+
+import asyncio
+import functools
+import time
+from dataclasses import dataclass, field
+
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+from ttl_store import ExpiringStore
+
+VERIFIED_TTL = 60.0
+VERIFIED_CACHE_MAX = 8192
+
+
+@dataclass
+class _Verified:
+    created_at: float = field(default_factory=time.monotonic)
+
+
+# (pubkey, message, signature) that verified recently; failures are never cached
+_verified = ExpiringStore(VERIFIED_TTL, max_size=VERIFIED_CACHE_MAX)
+
+
+@functools.lru_cache(maxsize=4096)
+def verify_key(pubkey_bytes: bytes) -> VerifyKey:
+    """Cached VerifyKey for a 32-byte public key. Raises like VerifyKey() on bad input."""
+    return VerifyKey(pubkey_bytes)
+
+
+def _verify_one(pubkey: bytes, message: bytes, signature: bytes) -> bool:
+    try:
+        verify_key(pubkey).verify(message, signature)
+    except (BadSignatureError, ValueError):
+        # ValueError: malformed key or signature length (nacl.exceptions.ValueError)
+        return False
+    return True
+
+
+async def verify_signature(pubkey: bytes, message: bytes, signature: bytes) -> bool:
+    """True if signature is a valid Ed25519 signature of message by pubkey."""
+    key = (bytes(pubkey), bytes(message), bytes(signature))
+    hit = _verified.get(key)
+    if hit is not None and time.monotonic() - hit.created_at <= VERIFIED_TTL:
+        return True
+    ok = await asyncio.to_thread(_verify_one, pubkey, message, signature)
+    if ok:
+        _verified.put(key, _Verified())
+    return ok
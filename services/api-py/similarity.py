@@ -1,7 +1,12 @@
 """TLSH + MobileCLIP2-S0 similarity computation.
 
 Call init_similarity() once at startup to load the CLIP model.
-Then use compute_tlsh() / compute_clip_embedding() per-file.
+Then use compute_hashes() and compute_clip_embedding() per file (they are
+independent, so callers run them in parallel threads), or compute_tlsh()
+when only the TLSH hash is needed.
+
+Image encodes from all request threads go through one batcher thread, which
+runs them as a single forward pass (on CUDA when available).
 
 Supports cross-modal embeddings:
   - Images: encode_image() via PIL
@@ -10,11 +15,16 @@ Supports cross-modal embeddings:
   - Text files: decode UTF-8, encode_text()
 """
 
+import hashlib
 import logging
 import os
+import queue
 import re
 import subprocess
 import tempfile
+import threading
+import time
+from concurrent.futures import Future
 from io import BytesIO
 
 import tlsh
@@ -28,14 +38,37 @@ _model = None
 _preprocess = None
 _tokenizer = None
 _device = "cpu"
+_image_queue: queue.Queue | None = None
 
 # Content types that should use text extraction → encode_text()
 _TEXT_CONTENT_TYPES = ("application/pdf", "text/")
 
+# Content types CLIP can embed at all; anything else (JSON, zip, audio...) is skipped.
+# init_similarity() can narrow this (e.g. to images only) via Settings.clip_content_types.
+_EMBED_CONTENT_TYPES = ("image/", "video/") + _TEXT_CONTENT_TYPES
+_embed_content_types = _EMBED_CONTENT_TYPES
+
+# Unlabelled uploads are sniffed as images
+_UNKNOWN_CONTENT_TYPES = ("", "application/octet-stream")
+
+# Slice size for the fused SHA-256 + TLSH pass
+HASH_CHUNK_SIZE = 256 * 1024
+
+# Image encode batching: up to CLIP_BATCH_MAX images per forward pass. On CUDA
+# the batcher waits CLIP_BATCH_WINDOW for company; on CPU it only takes what's queued.
+CLIP_BATCH_MAX = 32
+CLIP_BATCH_WINDOW = 0.008  # seconds
 
-def init_similarity():
-    """Load MobileCLIP2-S0 model. Call once at startup."""
-    global _model, _preprocess, _tokenizer, _device
+
+def init_similarity(content_types: tuple[str, ...] | None = None):
+    """Load MobileCLIP2-S0 model. Call once at startup.
+
+    content_types optionally restricts which content-type prefixes get embedded.
+    """
+    global _model, _preprocess, _tokenizer, _device, _embed_content_types
+
+    if content_types is not None:
+        _embed_content_types = tuple(content_types)
 
     log.info("Loading MobileCLIP2-S0 model...")
     model, _, preprocess = open_clip.create_model_and_transforms(
@@ -51,17 +84,110 @@ def init_similarity():
     _model = model
     _preprocess = preprocess
     _tokenizer = open_clip.get_tokenizer("MobileCLIP2-S0")
-    _device = "cpu"
+    _device = "cuda" if torch.cuda.is_available() else "cpu"
+    _model = _model.to(_device)
+    _start_image_batcher()
     log.info("MobileCLIP2-S0 loaded (device=%s)", _device)
 
 
+# ── Batched image encoding ──────────────────────────────────────────
+
+def _start_image_batcher():
+    global _image_queue
+    q = queue.Queue()
+    threading.Thread(target=_image_batch_loop, args=(q,), name="clip-batcher", daemon=True).start()
+    _image_queue = q
+
+
+def _next_image_batch(q: queue.Queue) -> list[tuple[torch.Tensor, Future]]:
+    batch = [q.get()]
+    window = CLIP_BATCH_WINDOW if _device == "cuda" else 0.0
+    deadline = time.monotonic() + window
+    while len(batch) < CLIP_BATCH_MAX:
+        try:
+            batch.append(q.get(timeout=max(deadline - time.monotonic(), 0.0)))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _image_batch_loop(q: queue.Queue):
+    while True:
+        batch = _next_image_batch(q)
+        try:
+            features = _encode_image_batch(torch.stack([t for t, _ in batch]))
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            continue
+        for (_, fut), row in zip(batch, features):
+            fut.set_result(row)
+
+
+def _submit_image(img: Image.Image) -> Future:
+    """Preprocess in the calling thread and queue the encode. Result is a normalized 512-dim tensor."""
+    fut = Future()
+    tensor = _preprocess(img.convert("RGB"))
+    if _image_queue is None:
+        fut.set_result(_encode_image_batch(tensor.unsqueeze(0))[0])
+    else:
+        _image_queue.put((tensor, fut))
+    return fut
+
+
+def _encode_image_batch(tensors: torch.Tensor) -> torch.Tensor:
+    with torch.no_grad():
+        features = _model.encode_image(tensors.to(_device))
+        features /= features.norm(dim=-1, keepdim=True)
+    return features.cpu()
+
+
 def compute_tlsh(file_bytes: bytes) -> str | None:
     """Compute TLSH hash from raw file bytes.
 
     Returns hex string (~70 chars) or None if file is too small/uniform.
     """
     h = tlsh.hash(file_bytes)
-    return h if h else None
+    return h if h and h != "TNULL" else None
+
+
+class ContentHasher:
+    """SHA-256 + TLSH fed the same chunks, for content that arrives in pieces."""
+
+    def __init__(self):
+        self._sha = hashlib.sha256()
+        self._tlsh = tlsh.Tlsh()
+        self.size = 0
+
+    def update(self, chunk: bytes | memoryview):
+        self._sha.update(chunk)
+        self._tlsh.update(chunk)
+        self.size += len(chunk)
+
+    def digests(self) -> tuple[str, str | None]:
+        """Returns (sha256_hex, tlsh_hash_or_None). Call once, after the last update."""
+        try:
+            self._tlsh.final()
+            tlsh_hash = self._tlsh.hexdigest()
+        except ValueError:
+            # Too small or not enough variation
+            tlsh_hash = None
+        return self._sha.hexdigest(), tlsh_hash
+
+
+def compute_hashes(file_bytes: bytes) -> tuple[str, str | None]:
+    """SHA-256 and TLSH for one file.
+
+    Both are fed the same slices in a single pass, so the bytes are only
+    streamed through memory once for both digests.
+
+    Returns (sha256_hex, tlsh_hash_or_None).
+    """
+    hasher = ContentHasher()
+    view = memoryview(file_bytes)
+    for start in range(0, len(view), HASH_CHUNK_SIZE):
+        hasher.update(view[start:start + HASH_CHUNK_SIZE])
+    return hasher.digests()
 
 
 def compute_clip_embedding(
@@ -69,10 +195,10 @@ def compute_clip_embedding(
 ) -> list[float] | None:
     """Compute CLIP embedding from file bytes.
 
-    Waterfall:
-      1. Try image encoding (PIL)
-      2. If image fails and content_type is video/* → sample 8 frames, average
-      3. If image fails and content_type is text-like → extract text, encode_text()
+    Content types CLIP can't use return None before any decoding. Otherwise:
+      1. image/* or unlabelled → try image encoding (PIL)
+      2. video/* → sample 8 frames, average
+      3. text-like → extract text, encode_text()
       4. Return None if nothing works
 
     Returns 512-dim L2-normalized float list, or None.
@@ -80,18 +206,16 @@ def compute_clip_embedding(
     if _model is None or _preprocess is None:
         return None
 
-    # 1. Try image encoding
-    try:
-        img = Image.open(BytesIO(file_bytes)).convert("RGB")
-        tensor = _preprocess(img).unsqueeze(0).to(_device)
-        with torch.no_grad():
-            features = _model.encode_image(tensor)
-            features /= features.norm(dim=-1, keepdim=True)
-        return features[0].tolist()
-    except Exception:
-        pass
+    ct = (content_type or "").split(";")[0].strip().lower()
+    if not should_embed(ct):
+        return None
 
-    ct = (content_type or "").lower()
+    # 1. Try image encoding
+    if ct.startswith("image/") or ct in _UNKNOWN_CONTENT_TYPES:
+        try:
+            return _encode_image(Image.open(BytesIO(file_bytes))).tolist()
+        except Exception:
+            pass
 
     # 2. Try video frame sampling
     if ct.startswith("video/"):
@@ -111,6 +235,18 @@ def compute_clip_embedding(
     return None
 
 
+def should_embed(ct: str) -> bool:
+    """Whether compute_clip_embedding can do anything with this (normalized) content type."""
+    if ct in _UNKNOWN_CONTENT_TYPES:
+        return "image/" in _embed_content_types
+    return ct.startswith(_embed_content_types)
+
+
+def _encode_image(img: Image.Image) -> torch.Tensor:
+    """Encode a decoded PIL image via the CLIP image encoder. Returns a normalized 512-dim tensor."""
+    return _submit_image(img).result()
+
+
 def _extract_text(file_bytes: bytes, content_type: str) -> str | None:
     """Extract text from a file based on its content type."""
     text = None
@@ -157,7 +293,7 @@ def _encode_text(text: str) -> list[float] | None:
         with torch.no_grad():
             features = _model.encode_text(tokens)
             features /= features.norm(dim=-1, keepdim=True)
-        return features[0].tolist()
+        return features[0].cpu().tolist()
     except Exception:
         log.debug("Text encoding failed", exc_info=True)
         return None
@@ -184,19 +320,21 @@ def _encode_video_frames(file_bytes: bytes, num_frames: int = 8) -> list[float]
         else:
             timestamps = [duration * i / (num_frames - 1) for i in range(num_frames)]
 
-        # Extract and encode each frame
-        embeddings = []
+        # Extract each frame and queue its encode; the frames share a batch
+        pending = []
         for ts in timestamps:
             frame_bytes = _extract_frame_at(tmp.name, ts)
             if frame_bytes is None:
                 continue
             try:
-                img = Image.open(BytesIO(frame_bytes)).convert("RGB")
-                tensor = _preprocess(img).unsqueeze(0).to(_device)
-                with torch.no_grad():
-                    features = _model.encode_image(tensor)
-                    features /= features.norm(dim=-1, keepdim=True)
-                embeddings.append(features[0])
+                pending.append(_submit_image(Image.open(BytesIO(frame_bytes))))
+            except Exception:
+                continue
+
+        embeddings = []
+        for fut in pending:
+            try:
+                embeddings.append(fut.result())
             except Exception:
                 continue
 
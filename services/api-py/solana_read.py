@@ -1,9 +1,8 @@
 import struct
 
 from solders.pubkey import Pubkey
-from solana.rpc.api import Client as SolanaClient
 
-from solana_tx import ATTESTATION_SEED, find_pda
+from solana_tx import attestation_pda, program_pubkey, rpc_client
 
 # ── Account discriminator ──────────────────────────────────────────
 ATTESTATION_DISC = bytes([152, 125, 183, 86, 36, 146, 121, 73])
@@ -78,7 +77,7 @@ def deserialize_attestation(data: bytes) -> dict | None:
         return None
 
 
-def lookup_attestation(rpc_url: str, program_id_str: str, content_hash_hex: str) -> dict | None:
+async def lookup_attestation(rpc_url: str, program_id_str: str, content_hash_hex: str) -> dict | None:
     try:
         content_hash_bytes = bytes.fromhex(content_hash_hex)
     except ValueError:
@@ -86,11 +85,9 @@ def lookup_attestation(rpc_url: str, program_id_str: str, content_hash_hex: str)
     if len(content_hash_bytes) != 32:
         return None
 
-    program_id = Pubkey.from_string(program_id_str)
-    pda, _ = find_pda([ATTESTATION_SEED, content_hash_bytes], program_id)
+    pda = attestation_pda(program_id_str, content_hash_bytes)
 
-    client = SolanaClient(rpc_url)
-    resp = client.get_account_info(pda)
+    resp = await rpc_client(rpc_url).get_account_info(pda)
     if resp.value is None:
         return None
 
@@ -98,13 +95,46 @@ def lookup_attestation(rpc_url: str, program_id_str: str, content_hash_hex: str)
     return deserialize_attestation(data)
 
 
-def list_all_attestations(rpc_url: str, program_id_str: str) -> list[dict]:
-    program_id = Pubkey.from_string(program_id_str)
-    client = SolanaClient(rpc_url)
+# getMultipleAccounts takes at most this many keys per call
+MULTIPLE_ACCOUNTS_MAX = 100
+
+
+async def lookup_attestations(rpc_url: str, program_id_str: str, content_hashes: list[str]) -> dict[str, dict]:
+    """On-chain attestations for many hashes via getMultipleAccounts, keyed by content hash.
+
+    Malformed hashes and missing accounts are absent from the result.
+    """
+    pdas = {}
+    for content_hash_hex in dict.fromkeys(content_hashes):
+        try:
+            content_hash_bytes = bytes.fromhex(content_hash_hex)
+        except ValueError:
+            continue
+        if len(content_hash_bytes) != 32:
+            continue
+        pdas[content_hash_hex] = attestation_pda(program_id_str, content_hash_bytes)
+
+    found = {}
+    client = rpc_client(rpc_url)
+    keys = list(pdas)
+    for start in range(0, len(keys), MULTIPLE_ACCOUNTS_MAX):
+        chunk = keys[start:start + MULTIPLE_ACCOUNTS_MAX]
+        resp = await client.get_multiple_accounts([pdas[h] for h in chunk])
+        for content_hash_hex, account in zip(chunk, resp.value):
+            if account is None:
+                continue
+            att = deserialize_attestation(account.data)
+            if att:
+                found[content_hash_hex] = att
+    return found
+
+
+async def list_all_attestations(rpc_url: str, program_id_str: str) -> list[dict]:
+    program_id = program_pubkey(program_id_str)
     items = []
 
     try:
-        resp = client.get_program_accounts(program_id)
+        resp = await rpc_client(rpc_url).get_program_accounts(program_id)
         for keyed in resp.value:
             data = keyed.account.data
             if len(data) < 8:
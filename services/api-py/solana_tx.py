@@ -1,3 +1,4 @@
+import functools
 import json
 import struct
 
@@ -8,7 +9,7 @@ from solders.keypair import Keypair
 from solders.message import Message
 from solders.pubkey import Pubkey
 from solders.transaction import Transaction
-from solana.rpc.api import Client as SolanaClient
+from solana.rpc.async_api import AsyncClient
 from solana.rpc.commitment import Confirmed
 
 SYSTEM_PROGRAM_ID = Pubkey.from_string("11111111111111111111111111111111")
@@ -23,27 +24,59 @@ SUBMIT_PROOF_DISC = bytes([54, 241, 46, 84, 4, 212, 46, 94])
 ATTESTATION_SEED = b"attestation"
 
 
+# ── Borsh encoding ──────────────────────────────────────────────────
+# Layouts are fixed, so the packers are compiled once at import
+
+_pack_u32 = struct.Struct("<I").pack
+_BORSH_BOOL = (b"\x00", b"\x01")
+
+
 def borsh_string(s: str) -> bytes:
     encoded = s.encode("utf-8")
-    return struct.pack("<I", len(encoded)) + encoded
+    return _pack_u32(len(encoded)) + encoded
 
 
 def borsh_vec(data: bytes) -> bytes:
-    return struct.pack("<I", len(data)) + data
+    return _pack_u32(len(data)) + data
 
 
+@functools.lru_cache(maxsize=4)
 def load_keypair(path: str) -> Keypair:
     with open(path) as f:
         secret = json.load(f)
     return Keypair.from_bytes(bytes(secret))
 
 
+@functools.lru_cache(maxsize=8)
+def program_pubkey(program_id_str: str) -> Pubkey:
+    """Parsed program id; settings.program_id is fixed per deploy."""
+    return Pubkey.from_string(program_id_str)
+
+
 def find_pda(seeds: list[bytes], program_id: Pubkey) -> tuple[Pubkey, int]:
     return Pubkey.find_program_address(seeds, program_id)
 
 
+@functools.lru_cache(maxsize=1024)
+def attestation_pda(program_id_str: str, content_hash: bytes) -> Pubkey:
+    """Attestation account address for a 32-byte content hash.
+
+    Memoized so lookups and retries of the same content skip the bump search.
+    """
+    pda, _ = find_pda([ATTESTATION_SEED, content_hash], program_pubkey(program_id_str))
+    return pda
+
+
 # ── Ed25519 precompile instruction ─────────────────────────────────
 
+# header (u8, u8) + Ed25519SignatureOffsets (7 x u16 LE)
+_ED25519_HEADER = struct.Struct("<BBHHHHHHH")
+_ED25519_SIG_OFFSET = 16       # where signature starts in instruction data
+_ED25519_PUBKEY_OFFSET = 80    # where pubkey starts
+_ED25519_MSG_OFFSET = 112      # where message starts
+_ED25519_SAME_IX = 0xFFFF      # data lives in this instruction (not external)
+
+
 def create_ed25519_instruction(
     pubkey: bytes,
     signature: bytes,
@@ -61,29 +94,13 @@ def create_ed25519_instruction(
     assert len(pubkey) == 32
     assert len(signature) == 64
 
-    sig_offset = 16          # where signature starts in instruction data
-    sig_ix_index = 0xFFFF    # same instruction (not external)
-    pubkey_offset = 80       # where pubkey starts
-    pubkey_ix_index = 0xFFFF
-    msg_offset = 112         # where message starts
-    msg_size = len(message)
-    msg_ix_index = 0xFFFF
-
-    data = bytearray()
-    # header
-    data += struct.pack("<BB", 1, 0)  # num_signatures=1, padding=0
-    # Ed25519SignatureOffsets
-    data += struct.pack("<HHHHHHH",
-        sig_offset, sig_ix_index,
-        pubkey_offset, pubkey_ix_index,
-        msg_offset, msg_size, msg_ix_index,
+    header = _ED25519_HEADER.pack(
+        1, 0,                     # num_signatures=1, padding=0
+        _ED25519_SIG_OFFSET, _ED25519_SAME_IX,
+        _ED25519_PUBKEY_OFFSET, _ED25519_SAME_IX,
+        _ED25519_MSG_OFFSET, len(message), _ED25519_SAME_IX,
     )
-    # signature + pubkey + message
-    data += signature
-    data += pubkey
-    data += message
-
-    return Instruction(ED25519_PROGRAM_ID, bytes(data), [])
+    return Instruction(ED25519_PROGRAM_ID, b"".join((header, signature, pubkey, message)), [])
 
 
 # ── Instruction data encoders ───────────────────────────────────────
@@ -105,20 +122,24 @@ def encode_attestation_data(
     verifier_version: str = "",
     trust_bundle_hash: str = "",
 ) -> bytes:
-    data = bytearray(SUBMIT_ATTESTATION_DISC)
-    data += content_hash
-    data += struct.pack("?", has_c2pa)
-    for s in [
-        trust_list_match, validation_state, digital_source_type,
-        issuer, common_name, software_agent, signing_time, cert_fingerprint,
-        email_domain,
-    ]:
-        data += borsh_string(s)
-    data += email_hash
-    data += wallet
-    data += borsh_string(verifier_version)
-    data += borsh_string(trust_bundle_hash)
-    return bytes(data)
+    return b"".join((
+        SUBMIT_ATTESTATION_DISC,
+        content_hash,
+        _BORSH_BOOL[bool(has_c2pa)],
+        borsh_string(trust_list_match),
+        borsh_string(validation_state),
+        borsh_string(digital_source_type),
+        borsh_string(issuer),
+        borsh_string(common_name),
+        borsh_string(software_agent),
+        borsh_string(signing_time),
+        borsh_string(cert_fingerprint),
+        borsh_string(email_domain),
+        email_hash,
+        wallet,
+        borsh_string(verifier_version),
+        borsh_string(trust_bundle_hash),
+    ))
 
 
 def encode_proof_data(
@@ -131,21 +152,48 @@ def encode_proof_data(
     verifier_version: str = "",
     trust_bundle_hash: str = "",
 ) -> bytes:
-    data = bytearray(SUBMIT_PROOF_DISC)
-    data += borsh_vec(proof_bytes)
-    data += borsh_vec(public_inputs_bytes)
-    data += content_hash
-    data += borsh_string(email_domain)
-    data += email_hash
-    data += wallet
-    data += borsh_string(verifier_version)
-    data += borsh_string(trust_bundle_hash)
-    return bytes(data)
+    return b"".join((
+        SUBMIT_PROOF_DISC,
+        borsh_vec(proof_bytes),
+        borsh_vec(public_inputs_bytes),
+        content_hash,
+        borsh_string(email_domain),
+        email_hash,
+        wallet,
+        borsh_string(verifier_version),
+        borsh_string(trust_bundle_hash),
+    ))
+
+
+# ── RPC clients ─────────────────────────────────────────────────────
+# One AsyncClient per RPC URL, so requests reuse its pooled connections.
+# close_rpc_clients() on shutdown.
+
+_rpc_clients: dict[str, AsyncClient] = {}
+
+
+def rpc_client(rpc_url: str) -> AsyncClient:
+    client = _rpc_clients.get(rpc_url)
+    if client is None:
+        client = _rpc_clients[rpc_url] = AsyncClient(rpc_url)
+    return client
+
+
+async def close_rpc_clients():
+    clients = list(_rpc_clients.values())
+    _rpc_clients.clear()
+    for client in clients:
+        await client.close()
 
 
 # ── Transaction builder ─────────────────────────────────────────────
 
-def build_and_send_tx(
+async def fetch_latest_blockhash(rpc_url: str) -> Hash:
+    """Fetch a recent blockhash ahead of time, e.g. alongside another RPC call."""
+    return (await rpc_client(rpc_url).get_latest_blockhash()).value.blockhash
+
+
+async def build_and_send_tx(
     rpc_url: str,
     keypair_path: str,
     program_id_str: str,
@@ -153,11 +201,15 @@ def build_and_send_tx(
     pda: Pubkey,
     compute_units: int = 200_000,
     extra_ixs: list[Instruction] | None = None,
+    blockhash: Hash | None = None,
 ) -> tuple[str, str]:
-    """Build, sign, and send a Solana transaction. Returns (signature, pda_str)."""
-    client = SolanaClient(rpc_url)
+    """Build, sign, and send a Solana transaction. Returns (signature, pda_str).
+
+    Pass a blockhash from fetch_latest_blockhash() to skip fetching one here.
+    """
+    client = rpc_client(rpc_url)
     payer = load_keypair(keypair_path)
-    program_id = Pubkey.from_string(program_id_str)
+    program_id = program_pubkey(program_id_str)
 
     accounts = [
         AccountMeta(pda, is_signer=False, is_writable=True),
@@ -175,8 +227,8 @@ def build_and_send_tx(
         all_ixs.extend(extra_ixs)
     all_ixs.append(ix)
 
-    blockhash_resp = client.get_latest_blockhash()
-    blockhash = blockhash_resp.value.blockhash
+    if blockhash is None:
+        blockhash = (await client.get_latest_blockhash()).value.blockhash
 
     msg = Message.new_with_blockhash(
         all_ixs,
@@ -186,9 +238,9 @@ def build_and_send_tx(
     tx = Transaction.new_unsigned(msg)
     tx.sign([payer], blockhash)
 
-    result = client.send_transaction(tx)
+    result = await client.send_transaction(tx)
     sig = str(result.value)
 
-    client.confirm_transaction(result.value, commitment=Confirmed)
+    await client.confirm_transaction(result.value, commitment=Confirmed)
 
     return sig, str(pda)
@@ -11,6 +11,40 @@ import os
 
 log = logging.getLogger(__name__)
 
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class FileChunks:
+    """Async iterator over a blocking file-like object, read off the event loop.
+
+    The file is closed at EOF or on a read error. Call aclose() if the chunks
+    will never be consumed; an unstarted generator couldn't do that.
+    """
+
+    def __init__(self, f):
+        self._f = f
+
+    def __aiter__(self) -> "FileChunks":
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            chunk = await asyncio.to_thread(self._f.read, READ_CHUNK_SIZE)
+        except BaseException:
+            self._f.close()
+            raise
+        if not chunk:
+            self._f.close()
+            raise StopAsyncIteration
+        return chunk
+
+    async def aclose(self):
+        self._f.close()
+
+
+# (chunks, content_type, size) — chunks is consumed once, e.g. by a StreamingResponse
+StoredContent = tuple[FileChunks, str, int]
+
 
 class ContentStore:
     """Abstract content store interface."""
@@ -18,7 +52,7 @@ class ContentStore:
     async def save(self, key: str, data: bytes, content_type: str) -> None:
         raise NotImplementedError
 
-    async def get(self, key: str) -> tuple[bytes, str] | None:
+    async def get(self, key: str) -> StoredContent | None:
         raise NotImplementedError
 
     async def exists(self, key: str) -> bool:
@@ -54,20 +88,25 @@ class LocalStore(ContentStore):
                 json.dump({"content_type": content_type}, f)
         await asyncio.to_thread(_write)
 
-    async def get(self, key: str) -> tuple[bytes, str] | None:
+    async def get(self, key: str) -> StoredContent | None:
         path = self._path(key)
         meta_path = self._meta_path(key)
-        if not os.path.exists(path):
-            return None
-        def _read():
-            with open(path, "rb") as f:
-                data = f.read()
+        def _open():
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                return None
+            size = os.fstat(f.fileno()).st_size
             ct = "application/octet-stream"
             if os.path.exists(meta_path):
-                with open(meta_path) as f:
-                    ct = json.load(f).get("content_type", ct)
-            return data, ct
-        return await asyncio.to_thread(_read)
+                with open(meta_path) as m:
+                    ct = json.load(m).get("content_type", ct)
+            return f, ct, size
+        opened = await asyncio.to_thread(_open)
+        if opened is None:
+            return None
+        f, ct, size = opened
+        return FileChunks(f), ct, size
 
     async def exists(self, key: str) -> bool:
         return os.path.exists(self._path(key))
@@ -107,17 +146,18 @@ class S3Store(ContentStore):
             )
         await asyncio.to_thread(_put)
 
-    async def get(self, key: str) -> tuple[bytes, str] | None:
+    async def get(self, key: str) -> StoredContent | None:
         s3_key = self._key(key)
         def _get():
             try:
-                resp = self._client.get_object(Bucket=self.bucket, Key=s3_key)
-                data = resp["Body"].read()
-                ct = resp.get("ContentType", "application/octet-stream")
-                return data, ct
+                return self._client.get_object(Bucket=self.bucket, Key=s3_key)
             except self._client.exceptions.NoSuchKey:
                 return None
-        return await asyncio.to_thread(_get)
+        resp = await asyncio.to_thread(_get)
+        if resp is None:
+            return None
+        ct = resp.get("ContentType", "application/octet-stream")
+        return FileChunks(resp["Body"]), ct, resp["ContentLength"]
 
     async def exists(self, key: str) -> bool:
         s3_key = self._key(key)
@@ -0,0 +1,54 @@
+"""In-memory stores whose entries expire a fixed time after they were created."""
+
+import time
+from collections import deque
+
+EXPIRY_SWEEP = 2  # expired entries reclaimed per insert
+MAX_ENTRIES = 50_000
+
+
+class ExpiringStore:
+    """Entries with a time.monotonic() created_at, dropped once older than ttl seconds.
+
+    The ttl is fixed, so insertion order is expiry order: each put reclaims at
+    most EXPIRY_SWEEP expired entries from the front of a queue instead of
+    scanning the whole store. Readers still check created_at themselves.
+
+    At most max_size inserts are tracked; past that the oldest is evicted
+    early, so memory stays bounded however fast keys are sprayed.
+    """
+
+    def __init__(self, ttl: float, max_size: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: dict = {}
+        self._queue: deque = deque()  # (created_at, key), oldest first
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str):
+        return self._entries.get(key)
+
+    def put(self, key: str, entry):
+        self._sweep()
+        self._entries[key] = entry
+        self._queue.append((entry.created_at, key))
+        while len(self._queue) > self.max_size:
+            self._drop_oldest()
+
+    def pop(self, key: str):
+        return self._entries.pop(key, None)
+
+    def _drop_oldest(self):
+        created_at, key = self._queue.popleft()
+        entry = self._entries.get(key)
+        if entry is not None and entry.created_at == created_at:  # not re-issued since
+            del self._entries[key]
+
+    def _sweep(self):
+        now = time.monotonic()
+        for _ in range(EXPIRY_SWEEP):
+            if not self._queue or now - self._queue[0][0] <= self.ttl:
+                return
+            self._drop_oldest()
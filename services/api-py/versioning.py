@@ -1,18 +1,51 @@
+import functools
 import hashlib
 import os
+import time
 
 VERIFIER_VERSION = "0.1.0"
 
+_TRUST_SUBDIRS = ("official", "curated")
 
-def compute_trust_bundle_hash(trust_dir: str) -> str:
-    """SHA-256 of sorted, concatenated PEM files from official/ and curated/ subdirs."""
-    hasher = hashlib.sha256()
-    for subdir in ["official", "curated"]:
+# The bundle is re-stat'ed at most this often; edits show up within this window
+TRUST_RESTAT_INTERVAL = 1.0  # seconds
+
+_stamps: dict[str, tuple[float, tuple]] = {}  # trust_dir -> (checked_at, stamp)
+
+
+def _trust_bundle_stamp(trust_dir: str) -> tuple:
+    """Cheap fingerprint of the bundle: (subdir, name, mtime_ns, size) per PEM file."""
+    stamp = []
+    for subdir in _TRUST_SUBDIRS:
         dirpath = os.path.join(trust_dir, subdir)
         if not os.path.isdir(dirpath):
             continue
-        pem_files = sorted(f for f in os.listdir(dirpath) if f.endswith(".pem"))
-        for fname in pem_files:
-            with open(os.path.join(dirpath, fname), "rb") as f:
-                hasher.update(f.read())
+        with os.scandir(dirpath) as entries:
+            pem_files = sorted((e for e in entries if e.name.endswith(".pem")), key=lambda e: e.name)
+        for entry in pem_files:
+            st = entry.stat()
+            stamp.append((subdir, entry.name, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+@functools.lru_cache(maxsize=4)
+def _hash_trust_bundle(trust_dir: str, stamp: tuple) -> str:
+    hasher = hashlib.sha256()
+    for subdir, fname, _, _ in stamp:
+        with open(os.path.join(trust_dir, subdir, fname), "rb") as f:
+            hasher.update(f.read())
     return hasher.hexdigest()
+
+
+def compute_trust_bundle_hash(trust_dir: str) -> str:
+    """SHA-256 of sorted, concatenated PEM files from official/ and curated/ subdirs.
+
+    Memoized on the files' names, mtimes and sizes, so the PEMs are only
+    re-read when the bundle changes on disk; those are re-checked at most
+    every TRUST_RESTAT_INTERVAL.
+    """
+    now = time.monotonic()
+    cached = _stamps.get(trust_dir)
+    if cached is None or now - cached[0] > TRUST_RESTAT_INTERVAL:
+        cached = _stamps[trust_dir] = (now, _trust_bundle_stamp(trust_dir))
+    return _hash_trust_bundle(trust_dir, cached[1])
@@ -1,7 +1,7 @@
 import axios from 'axios'
 import type {
   VerifyOutput, ProveResponse, SubmitResponse, AttestResponse, AttestationResponse,
-  AttestationListItem, SimilarResponse, MeResponse, OrgInfo, OrgKeyItem,
+  AttestationPage, SimilarResponse, MeResponse, OrgInfo, OrgKeyItem,
 } from './types'
 
 const client = axios.create({ baseURL: '/api' })
@@ -56,8 +56,8 @@ export async function lookupAttestation(hash: string): Promise<AttestationRespon
   return data
 }
 
-export async function listAttestations(): Promise<AttestationListItem[]> {
-  const { data } = await client.get<AttestationListItem[]>('/attestations')
+export async function listAttestations(cursor?: string): Promise<AttestationPage> {
+  const { data } = await client.get<AttestationPage>('/attestations', { params: { cursor } })
   return data
 }
 
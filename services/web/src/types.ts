@@ -84,6 +84,11 @@ export interface AttestationListItem {
   stored?: boolean
 }
 
+export interface AttestationPage {
+  items: AttestationListItem[]
+  next_cursor: string | null
+}
+
 export interface SimilarMatch {
   content_hash: string
   match_type: 'exact' | 'near_duplicate' | 'visual_match' | 'unrelated'